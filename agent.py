@@ -1,32 +1,203 @@
+import argparse
+import asyncio
+import json
 import os
+import sys
+import time
 from dotenv import load_dotenv, find_dotenv
 _ = load_dotenv(find_dotenv())
-from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
 
+# langchain/langgraph are imported on first use, so `--help` and argument or
+# input errors don't pay for loading them
+
+DEFAULT_QUERY = "Tell me the recent movies list in 2025"
 
 
 # Access the variables
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 TAVILY_API_KEY = os.getenv('TAVILY_API_KEY')
 
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
 
+def run_one(query, model_name, max_results):
+    """Answer a single question, streaming tool calls and tokens to the terminal."""
+    from langchain_core.messages import HumanMessage
+    from agent_factory import get_agent, AUTO_MODEL
+    from streaming import stream_agent
+    from response_cache import get_answer_cache, cached_stream, openai_embedder
+    from routing import get_router
+
+    def stream_for(model, retry=False):
+        agent_executor = get_agent(model, max_results, OPENAI_API_KEY, TAVILY_API_KEY)
+        return stream_agent(agent_executor, [HumanMessage(content=query)])
+
+    if model_name == AUTO_MODEL:
+        stream = lambda: get_router().stream(query, stream_for)
+    else:
+        stream = lambda: stream_for(model_name)
+
+    # Stream tool calls and tokens to the terminal as they arrive, or answer from the cache
+    events = cached_stream(
+        get_answer_cache(),
+        query,
+        f"{model_name}:{max_results}",
+        stream,
+        embed=openai_embedder(OPENAI_API_KEY),
+    )
+    for event in events:
+        if event["type"] == "tool_start":
+            print(f"\n[{event['name']}] {event['input']}", flush=True)
+        elif event["type"] == "tool_end":
+            print(f"[{event['name']}] returned {len(event['output'])} characters", flush=True)
+        elif event["type"] == "token":
+            print(event["content"], end="", flush=True)
+        elif event["type"] == "escalate":
+            print(f"\n[{event['from']} -> {event['to']}] {event['reason']}", flush=True)
+        elif event["type"] == "final":
+            if event.get("cached"):
+                print(f"(cached, {event['cached']} match) {event['content']}", end="")
+            print()
+            for number, source in enumerate(event.get("sources") or [], 1):
+                print(f"[{number}] {source['url']}")
+
+
+def parse_query(line):
+    """The request on one JSONL line, or None for a blank line.
+
+    Plain-text lines are accepted as bare queries; invalid lines get an
+    ``error`` so they show up in the output instead of stopping the batch.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        request = json.loads(line) if line.startswith("{") else {"query": line}
+    except ValueError as e:
+        request = {"error": f"invalid JSON: {e}"}
+    if "error" not in request and not isinstance(request.get("query"), str):
+        request = {"error": "missing 'query' string"}
+    return request
+
+
+async def read_queries(source):
+    """Yield ``(line_number, request)`` for each non-blank line of the file object ``source``.
+
+    Lines are read in a worker thread, so slow input (e.g. a pipe) doesn't
+    stall the runs already in flight on the event loop.
+    """
+    number = 0
+    while True:
+        line = await asyncio.to_thread(source.readline)
+        if not line:
+            return
+        number += 1
+        request = parse_query(line)
+        if request is not None:
+            yield number, request
+
+
+async def answer_request(request, model_name, max_results):
+    from response_cache import get_answer_cache, acached_stream, openai_embedder
+    from agent_factory import get_agent, AUTO_MODEL
+    from routing import get_router
+    from streaming import astream_agent
+    from telemetry import Trace, atraced
+
+    model_name = request.get("model", model_name)
+    max_results = int(request.get("max_results", max_results))
+    trace = Trace("batch")
+
+    def astream_for(model, retry=False):
+        agent_executor = get_agent(model, max_results, OPENAI_API_KEY, TAVILY_API_KEY)
+        return astream_agent(agent_executor, request["query"], {"callbacks": [trace.handler]})
+
+    if model_name == AUTO_MODEL:
+        stream = lambda: get_router().astream(request["query"], astream_for)
+    else:
+        stream = lambda: astream_for(model_name)
+    events = atraced(acached_stream(
+        get_answer_cache(),
+        request["query"],
+        f"{model_name}:{max_results}",
+        stream,
+        embed=openai_embedder(OPENAI_API_KEY),
+    ), trace)
+    result = {"answer": None, "sources": [], "cached": None, "tool_calls": 0, "timing": None, "route": None}
+    async for event in events:
+        if event["type"] == "tool_start":
+            result["tool_calls"] += 1
+        elif event["type"] == "final":
+            result["answer"] = event["content"]
+            result["sources"] = event.get("sources") or []
+            result["cached"] = event.get("cached")
+            result["timing"] = event.get("timing")
+            result["route"] = event.get("route")
+    return result
+
+
+async def run_batch(source, output, workers, model_name, max_results):
+    """Answer every query in the file object ``source`` with up to ``workers`` runs in flight.
+
+    Results are written to ``output`` as JSONL in completion order; each record
+    carries the request's ``id`` (or its line number) to match it up.
+    """
+    slots = asyncio.Semaphore(workers)
+    pending = set()
+
+    async def process(number, request):
+        started = time.perf_counter()
+        record = {"id": request.get("id", number), "query": request.get("query")}
+        try:
+            if "error" in request:
+                record["error"] = request["error"]
+            else:
+                record.update(await answer_request(request, model_name, max_results))
+        except Exception as e:
+            record["error"] = str(e)
+        finally:
+            slots.release()
+        record["elapsed"] = round(time.perf_counter() - started, 3)
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    async for number, request in read_queries(source):
+        # Acquire before creating the task so a large input file is never read ahead of the workers
+        await slots.acquire()
+        task = asyncio.create_task(process(number, request))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
 
-chatModel = ChatOpenAI(model="gpt-3.5-turbo-0125")
-search = TavilySearchResults(max_results=3)
 
-# res = search.invoke("Tell me the recent movies list in 2025")
-# print(res)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ask the AI search assistant from the command line.")
+    parser.add_argument("query", nargs="?", default=DEFAULT_QUERY, help="question to answer")
+    parser.add_argument("--batch", metavar="FILE", help="answer the queries in a JSONL file ('-' for stdin)")
+    parser.add_argument("--output", metavar="FILE", default="-", help="where to write batch results (default: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent agent runs in batch mode")
+    parser.add_argument("--model", default="gpt-3.5-turbo-0125", help="OpenAI model name, or 'auto' to route each question")
+    parser.add_argument("--max-results", type=int, default=3, help="search results per query")
+    args = parser.parse_args(argv)
 
-tool = [search]
+    if not OPENAI_API_KEY or not TAVILY_API_KEY:
+        parser.error("OPENAI_API_KEY and TAVILY_API_KEY must be set (environment or .env file)")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
 
-agent_executor = create_react_agent(chatModel, tool)
+    if args.batch is None:
+        run_one(args.query, args.model, args.max_results)
+        return
 
+    source = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    try:
+        asyncio.run(run_batch(source, output, args.workers, args.model, args.max_results))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
 
-response = agent_executor.invoke({"messages": [HumanMessage(content="Tell me the recent movies list in 2025")]})
 
-print(response['messages'])
\ No newline at end of file
+if __name__ == "__main__":
+    main()
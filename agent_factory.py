@@ -0,0 +1,161 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from telemetry import get_metrics
+
+# langchain_openai, the Tavily tool and langgraph take seconds to import and
+# are only needed to build an agent, so they are imported in build_agent
+# (see warmup.py) rather than here
+
+# Picks the model per question (see routing.py); not a model get_agent can build
+AUTO_MODEL = "auto"
+
+# Models offered to users, shared by the Streamlit app and the API service
+MODEL_OPTIONS = {
+    "gpt-3.5-turbo-0125": "GPT-3.5 Turbo (Faster, Lower Cost)",
+    "gpt-4-turbo-preview": "GPT-4 Turbo (More Capable, Higher Cost)",
+    AUTO_MODEL: "Auto (Fast Model, Capable Model When Needed)",
+}
+DEFAULT_MODEL = "gpt-3.5-turbo-0125"
+DEFAULT_MAX_RESULTS = 3
+MAX_SEARCH_RESULTS = 10
+
+# Maximum number of compiled agents kept alive in this process
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "16"))
+
+
+def key_fingerprint(*api_keys):
+    """Return a short, non-reversible fingerprint of the given API keys."""
+    digest = hashlib.sha256("\0".join(k or "" for k in api_keys).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def build_agent(model_name, max_results, openai_api_key, tavily_api_key, memory=False):
+    """Create the chat model, the search tool and the compiled ReAct graph.
+
+    The API keys are given to this agent's clients only; nothing is read from
+    or written to ``os.environ``, so sessions with different keys can share a
+    process. With ``memory`` the graph keeps per-session conversation history
+    in the shared checkpointer (pass ``memory.session_config(thread_id)`` when
+    running it).
+    """
+    from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
+    from langchain_openai import ChatOpenAI
+    from memory import get_checkpointer
+    from react_graph import create_search_agent
+    from search_cache import CachedTavilySearchResults
+    from upstream import UPSTREAM_TIMEOUT, get_async_http_client, get_http_client
+
+    # Streaming lets callers render tokens as they arrive; usage is still reported.
+    # Requests share pooled connections, and the transport retries them instead of the SDK
+    chat_model = ChatOpenAI(
+        model=model_name,
+        api_key=openai_api_key,
+        streaming=True,
+        stream_usage=True,
+        http_client=get_http_client("openai"),
+        http_async_client=get_async_http_client("openai"),
+        max_retries=0,
+        timeout=UPSTREAM_TIMEOUT,
+    )
+    # Search results are cached and deduplicated across runs and sessions
+    search = CachedTavilySearchResults(
+        max_results=max_results,
+        api_wrapper=TavilySearchAPIWrapper(tavily_api_key=tavily_api_key),
+    )
+    # Tool calls of one step run concurrently (see tool_node.ParallelToolNode)
+    return create_search_agent(chat_model, [search], checkpointer=get_checkpointer() if memory else None)
+
+
+class AgentCache:
+    """Thread-safe LRU cache of compiled agents with hit/miss accounting."""
+
+    def __init__(self, maxsize=AGENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._agents = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, builder):
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is not None:
+                self._agents.move_to_end(key)
+                self.hits += 1
+                return agent
+            # Concurrent sessions asking for a configuration that is being
+            # built wait for that build instead of compiling the graph twice
+            future = self._building.get(key)
+            if future is None:
+                self.misses += 1
+                future = self._building[key] = Future()
+                building = True
+            else:
+                self.hits += 1
+                building = False
+        if not building:
+            return future.result()
+
+        # Build outside the lock so other configurations aren't held up
+        try:
+            agent = builder()
+        except BaseException as e:
+            with self._lock:
+                self._building.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._building.pop(key, None)
+            self._agents[key] = agent
+            while len(self._agents) > self.maxsize:
+                self._agents.popitem(last=False)
+                self.evictions += 1
+        future.set_result(agent)
+        return agent
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._agents),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._agents.clear()
+
+
+# Process-wide cache shared by every Streamlit session and rerun
+_agent_cache = AgentCache()
+get_metrics().add_stats("agent_cache", _agent_cache.stats)
+
+
+def get_agent(model_name, max_results, openai_api_key, tavily_api_key, memory=False):
+    """Return a compiled agent for this configuration, building it on first use.
+
+    Each agent holds the keys it was built with, and the cache key only holds
+    their fingerprint, so different users never share an agent that was built
+    with someone else's credentials. All agents share the pooled connections
+    of upstream.py; the keys travel with each request.
+    """
+    key = (model_name, int(max_results), key_fingerprint(openai_api_key, tavily_api_key), memory)
+    return _agent_cache.get(
+        key, lambda: build_agent(model_name, int(max_results), openai_api_key, tavily_api_key, memory=memory)
+    )
+
+
+def agent_cache_stats():
+    return _agent_cache.stats()
+
+
+def clear_agent_cache():
+    _agent_cache.clear()
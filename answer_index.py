@@ -0,0 +1,301 @@
+"""Precomputed answers to recurring questions.
+
+Much of the traffic asks the same questions again and again ("latest
+developments in AI"). The questions listed in ``ANSWER_INDEX_QUERIES`` are
+answered ahead of time: a background thread re-runs each one through the
+agent every ``ANSWER_INDEX_REFRESH`` seconds and stores the answer with its
+sources in :class:`AnswerIndex`. A matching user question (same words minus
+filler, or a similar embedding) is answered from the index without an agent
+run, and the answer's age is shown with it. Answers older than
+``ANSWER_INDEX_MAX_AGE`` (e.g. after failed refreshes) are not served.
+
+Refreshes use the service's own ``OPENAI_API_KEY`` and ``TAVILY_API_KEY``.
+Worker processes sharing the index file take turns: each question is claimed
+before it is refreshed, so only one of them runs it.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from agent_factory import DEFAULT_MAX_RESULTS, DEFAULT_MODEL, get_agent
+from response_cache import _safe_embed, canonical_query, openai_embedder
+from telemetry import Trace, get_metrics, traced
+from warmup import load_agent_modules
+
+# Answer index settings
+ANSWER_INDEX_QUERIES = os.getenv("ANSWER_INDEX_QUERIES", "")  # file with one question per line; empty disables the index
+ANSWER_INDEX_PATH = os.getenv("ANSWER_INDEX_PATH", "answer_index.sqlite3")
+ANSWER_INDEX_REFRESH = float(os.getenv("ANSWER_INDEX_REFRESH", "21600"))
+ANSWER_INDEX_MAX_AGE = float(os.getenv("ANSWER_INDEX_MAX_AGE", "86400"))
+ANSWER_INDEX_MODEL = os.getenv("ANSWER_INDEX_MODEL", DEFAULT_MODEL)
+ANSWER_INDEX_MAX_RESULTS = int(os.getenv("ANSWER_INDEX_MAX_RESULTS", str(DEFAULT_MAX_RESULTS)))
+ANSWER_INDEX_SIMILARITY = float(os.getenv("ANSWER_INDEX_SIMILARITY", "0.92"))
+
+# Seconds between checks for due questions, and how long a claim on one lasts
+_CHECK_INTERVAL = 60
+_CLAIM_SECONDS = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_answers (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    answer TEXT,
+    sources TEXT,
+    model TEXT,
+    embedding BLOB,
+    refreshed_at REAL,
+    claimed_at REAL
+);
+"""
+
+logger = logging.getLogger("answer_index")
+
+
+def read_queries(path=ANSWER_INDEX_QUERIES):
+    """The questions in ``path``, one per line; blank lines and ``#`` comments are skipped."""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class AnswerIndex:
+    """Stored answers to the configured questions, keyed by their canonical form.
+
+    Thread-safe, and worker processes may share the SQLite file.
+    """
+
+    def __init__(self, path=ANSWER_INDEX_PATH, max_age=ANSWER_INDEX_MAX_AGE,
+                 similarity_threshold=ANSWER_INDEX_SIMILARITY):
+        self.max_age = max_age
+        self.similarity_threshold = similarity_threshold
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.refreshed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def set_queries(self, queries):
+        """Make ``queries`` the indexed questions; answers to questions no longer listed are dropped."""
+        keys = {canonical_query(q): q for q in queries}
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO indexed_answers (key, query) VALUES (?, ?)", list(keys.items())
+            )
+            stored = [key for key, in self._db.execute("SELECT key FROM indexed_answers")]
+            self._db.executemany(
+                "DELETE FROM indexed_answers WHERE key = ?", [(key,) for key in stored if key not in keys]
+            )
+            self._db.commit()
+
+    def lookup(self, query, embed=None):
+        """Return ``{"answer", "query", "sources", "model", "refreshed_at", "age", "tier"}`` for a match, else None."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT query, answer, sources, model, refreshed_at FROM indexed_answers "
+                "WHERE key = ? AND refreshed_at >= ?",
+                (canonical_query(query), now - self.max_age),
+            ).fetchone()
+            if row is not None:
+                return self._hit("exact", row, now)
+            candidates = self._db.execute(
+                "SELECT query, answer, sources, model, refreshed_at, embedding FROM indexed_answers "
+                "WHERE embedding IS NOT NULL AND refreshed_at >= ?",
+                (now - self.max_age,),
+            ).fetchall()
+            if embed is None or not candidates:
+                self.misses += 1
+                return None
+
+        # Embed outside the lock, this may be a network call
+        vector = _safe_embed(embed, query)
+        with self._lock:
+            if vector is not None:
+                scores = np.stack([np.frombuffer(c[-1], dtype=np.float32) for c in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    return self._hit("semantic", candidates[best][:-1], now)
+            self.misses += 1
+            return None
+
+    def due(self, interval=ANSWER_INDEX_REFRESH):
+        """Questions whose answer is missing or older than ``interval`` seconds, stalest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT query FROM indexed_answers WHERE refreshed_at IS NULL OR refreshed_at < ? "
+                "ORDER BY refreshed_at IS NOT NULL, refreshed_at",
+                (time.time() - interval,),
+            ).fetchall()
+        return [query for query, in rows]
+
+    def claim(self, query):
+        """Reserve ``query`` for refreshing; False if another thread or process is already on it."""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE indexed_answers SET claimed_at = ? WHERE key = ? AND (claimed_at IS NULL OR claimed_at < ?)",
+                (now, canonical_query(query), now - _CLAIM_SECONDS),
+            )
+            self._db.commit()
+            return cursor.rowcount == 1
+
+    def store(self, query, answer, sources, model, embed=None):
+        vector = _safe_embed(embed, query) if embed is not None else None
+        with self._lock:
+            self._db.execute(
+                "UPDATE indexed_answers SET answer = ?, sources = ?, model = ?, embedding = ?, refreshed_at = ?, "
+                "claimed_at = NULL WHERE key = ?",
+                (answer, json.dumps(sources, separators=(",", ":")), model,
+                 None if vector is None else vector.tobytes(), time.time(), canonical_query(query)),
+            )
+            self._db.commit()
+            self.refreshed += 1
+
+    def mark_failed(self, query):
+        """Count a failed refresh of ``query``; its claim is kept until it lapses, which delays the retry."""
+        with self._lock:
+            self.failed += 1
+
+    def stats(self):
+        with self._lock:
+            size, answered = self._db.execute("SELECT COUNT(*), COUNT(answer) FROM indexed_answers").fetchone()
+            return {**{f"{tier}_hits": n for tier, n in self.hits.items()}, "misses": self.misses,
+                    "size": size, "answered": answered, "refreshed": self.refreshed, "failed": self.failed}
+
+    def _hit(self, tier, row, now):
+        query, answer, sources, model, refreshed_at = row
+        self.hits[tier] += 1
+        return {"answer": answer, "query": query, "sources": json.loads(sources or "[]"), "model": model,
+                "refreshed_at": refreshed_at, "age": now - refreshed_at, "tier": tier}
+
+
+def refresh_answer(index, query, openai_api_key, tavily_api_key,
+                   model_name=ANSWER_INDEX_MODEL, max_results=ANSWER_INDEX_MAX_RESULTS):
+    """Run ``query`` through the agent and store the answer; returns the refresh outcome."""
+    load_agent_modules()
+    from streaming import stream_agent
+
+    if not index.claim(query):
+        return "claimed"
+    trace = Trace("index")
+    final = None
+    try:
+        agent = get_agent(model_name, max_results, openai_api_key, tavily_api_key)
+        for event in traced(stream_agent(agent, query, config={"callbacks": [trace.handler]}), trace):
+            if event["type"] == "final":
+                final = event
+    except Exception as e:
+        logger.warning("refreshing indexed answer to %r failed: %s", query, e)
+    # An answer cut short by the run budget may be incomplete; keep serving the previous one
+    if final is None or final.get("cutoff"):
+        index.mark_failed(query)
+        return "failed" if final is None else "cutoff"
+    index.store(query, final["content"], final["sources"], model_name,
+                embed=openai_embedder(openai_api_key))
+    return "ok"
+
+
+class AnswerIndexRefresher:
+    """Background thread that refreshes the index's due questions one at a time."""
+
+    def __init__(self, index, openai_api_key, tavily_api_key, interval=ANSWER_INDEX_REFRESH):
+        self.index = index
+        self.openai_api_key = openai_api_key
+        self.tavily_api_key = tavily_api_key
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="answer-index", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh_due(self):
+        for query in self.index.due(self.interval):
+            if self._stop.is_set():
+                return
+            outcome = refresh_answer(self.index, query, self.openai_api_key, self.tavily_api_key)
+            get_metrics().inc("answer_index_refresh_total", outcome=outcome)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_due()
+            except Exception as e:
+                logger.warning("answer index refresh failed: %s", e)
+            self._stop.wait(min(_CHECK_INTERVAL, self.interval))
+
+
+_index = None
+_refresher = None
+_index_lock = threading.Lock()
+
+
+def get_answer_index():
+    """Return the process-wide answer index, or None when ``ANSWER_INDEX_QUERIES`` is unset."""
+    global _index
+    if not ANSWER_INDEX_QUERIES:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = AnswerIndex()
+            _index.set_queries(read_queries())
+            get_metrics().add_stats("answer_index", _index.stats)
+        return _index
+
+
+def start_answer_index():
+    """Start refreshing the index in a background thread (once per process).
+
+    Does nothing when no questions are configured or the service's API keys are missing.
+    """
+    global _refresher
+    index = get_answer_index()
+    if index is None:
+        return
+    openai_api_key = os.getenv("OPENAI_API_KEY", "")
+    tavily_api_key = os.getenv("TAVILY_API_KEY", "")
+    with _index_lock:
+        if _refresher is not None:
+            return
+        if not openai_api_key or not tavily_api_key:
+            logger.warning("answer index not refreshed: OPENAI_API_KEY and TAVILY_API_KEY must be set")
+            return
+        _refresher = AnswerIndexRefresher(index, openai_api_key, tavily_api_key)
+        _refresher.start()
+
+
+def indexed_stream(index, query, stream, embed=None):
+    """Answer ``query`` from ``index`` with a single ``final`` event, or else yield from ``stream()``."""
+    hit = index.lookup(query, embed) if index is not None else None
+    if hit is None:
+        yield from stream()
+        return
+    yield {"type": "final", "content": hit["answer"], "messages": [], "sources": hit["sources"], "cached": "index",
+           "indexed": _public_hit(hit)}
+
+
+async def aindexed_stream(index, query, stream, embed=None):
+    """Async counterpart of :func:`indexed_stream`; the lookup runs in a worker thread."""
+    hit = await asyncio.to_thread(index.lookup, query, embed) if index is not None else None
+    if hit is None:
+        async for event in stream():
+            yield event
+        return
+    yield {"type": "final", "content": hit["answer"], "messages": [], "sources": hit["sources"], "cached": "index",
+           "indexed": _public_hit(hit)}
+
+
+def _public_hit(hit):
+    return {k: hit[k] for k in ("query", "model", "refreshed_at", "age")}
@@ -1,11 +1,18 @@
 import os
 import time
+import uuid
 import streamlit as st
 from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
+from agent_factory import get_agent, agent_cache_stats, MODEL_OPTIONS, AUTO_MODEL
+from answer_index import get_answer_index, indexed_stream, start_answer_index
+from conversations import CONVERSATION_MAX_LOADED, CONVERSATION_PAGE_SIZE, get_conversation_store
+from prefetch import PREFETCH_ENABLED, get_prefetcher
+from response_cache import get_answer_cache, cached_stream, embed_once, openai_embedder
+from run_queue import get_run_queue
+from rendering import history_blocks, render_partial, render_thinking, timing_table
+from telemetry import Trace, traced, observe_render, start_metrics_server, get_metrics
+from upstream import describe_error
+from warmup import import_times, load_agent_modules, prewarm_agent_modules
 
 # Set page configuration - MUST BE THE FIRST STREAMLIT COMMAND
 st.set_page_config(
@@ -18,6 +25,12 @@ st.set_page_config(
 # Load environment variables (for local development)
 _ = load_dotenv(find_dotenv())
 
+# Time this script run and expose /metrics when TELEMETRY_METRICS_PORT is set
+script_started = time.perf_counter()
+start_metrics_server()
+# Keep the precomputed answers to recurring questions fresh (when ANSWER_INDEX_QUERIES is set)
+start_answer_index()
+
 # Initialize session state for API keys if not already present
 if "openai_api_key" not in st.session_state:
     st.session_state.openai_api_key = os.getenv('OPENAI_API_KEY', '')
@@ -25,174 +38,27 @@ if "tavily_api_key" not in st.session_state:
     st.session_state.tavily_api_key = os.getenv('TAVILY_API_KEY', '')
 if "api_keys_valid" not in st.session_state:
     st.session_state.api_keys_valid = False
-if "messages" not in st.session_state:
-    st.session_state.messages = []
 if "thinking" not in st.session_state:
     st.session_state.thinking = False
+if "active_run" not in st.session_state:
+    st.session_state.active_run = None
+if "thread_id" not in st.session_state:
+    # Identifies this conversation in the store and the agent's checkpointer (multi-turn
+    # memory). It's kept in the URL, so a reload or another worker picks the transcript up again
+    requested = st.query_params.get("conversation")
+    if requested and get_conversation_store().exists(requested):
+        st.session_state.thread_id = requested
+        st.session_state.messages, st.session_state.has_older = get_conversation_store().page(requested)
+    else:
+        st.session_state.thread_id = uuid.uuid4().hex
+        st.session_state.messages, st.session_state.has_older = [], False
+    st.query_params["conversation"] = st.session_state.thread_id
 
-# Custom CSS for a more professional look
-st.markdown("""
-<style>
-    .main-header {
-        font-family: 'Helvetica Neue', sans-serif;
-        font-weight: 700;
-        color: #1E88E5;
-    }
-    .sub-header {
-        font-family: 'Helvetica Neue', sans-serif;
-        font-weight: 600;
-        color: #333;
-    }
-    .chat-message {
-        padding: 1.5rem;
-        border-radius: 0.8rem;
-        margin-bottom: 1rem;
-        display: flex;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-    }
-    .chat-message.user {
-        background-color: #E3F2FD;
-        border-left: 5px solid #1E88E5;
-    }
-    .chat-message.assistant {
-        background-color: #F5F5F5;
-        border-left: 5px solid #4CAF50;
-    }
-    .chat-message .avatar {
-        width: 40px;
-        height: 40px;
-        border-radius: 50%;
-        object-fit: cover;
-        margin-right: 1rem;
-    }
-    .chat-message .message {
-        flex-grow: 1;
-    }
-    .highlight {
-        background-color: #E3F2FD;
-        padding: 0.2rem 0.5rem;
-        border-radius: 0.3rem;
-        font-weight: bold;
-        color: #1E88E5;
-    }
-    .stButton button {
-        background-color: #1E88E5;
-        color: white;
-        border-radius: 20px;
-        padding: 0.5rem 1rem;
-        border: none;
-        font-weight: bold;
-        transition: all 0.3s;
-    }
-    .stButton button:hover {
-        background-color: #1565C0;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-    }
-    .clear-button button {
-        background-color: #F5F5F5;
-        color: #333;
-        border: 1px solid #ddd;
-    }
-    .clear-button button:hover {
-        background-color: #EEEEEE;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-    }
-    .api-form {
-        background-color: #F5F5F5;
-        padding: 1.5rem;
-        border-radius: 0.8rem;
-        margin-bottom: 1rem;
-        border: 1px solid #ddd;
-    }
-    .source-link {
-        font-size: 0.8rem;
-        color: #1E88E5;
-        text-decoration: none;
-    }
-    .source-link:hover {
-        text-decoration: underline;
-    }
-    .thinking-animation {
-        display: inline-block;
-        position: relative;
-        width: 80px;
-        height: 20px;
-    }
-    .thinking-animation div {
-        position: absolute;
-        top: 8px;
-        width: 10px;
-        height: 10px;
-        border-radius: 50%;
-        background: #1E88E5;
-        animation-timing-function: cubic-bezier(0, 1, 1, 0);
-    }
-    .thinking-animation div:nth-child(1) {
-        left: 8px;
-        animation: thinking1 0.6s infinite;
-    }
-    .thinking-animation div:nth-child(2) {
-        left: 8px;
-        animation: thinking2 0.6s infinite;
-    }
-    .thinking-animation div:nth-child(3) {
-        left: 32px;
-        animation: thinking2 0.6s infinite;
-    }
-    .thinking-animation div:nth-child(4) {
-        left: 56px;
-        animation: thinking3 0.6s infinite;
-    }
-    @keyframes thinking1 {
-        0% {transform: scale(0);}
-        100% {transform: scale(1);}
-    }
-    @keyframes thinking3 {
-        0% {transform: scale(1);}
-        100% {transform: scale(0);}
-    }
-    @keyframes thinking2 {
-        0% {transform: translate(0, 0);}
-        100% {transform: translate(24px, 0);}
-    }
-    .stTextInput input {
-        border-radius: 20px;
-        padding: 0.5rem 1rem;
-        border: 1px solid #ddd;
-    }
-    .stTextInput input:focus {
-        border-color: #1E88E5;
-        box-shadow: 0 0 0 0.2rem rgba(30, 136, 229, 0.25);
-    }
-    .sidebar-content {
-        background-color: #F5F5F5;
-        padding: 1rem;
-        border-radius: 0.8rem;
-        margin-bottom: 1rem;
-    }
-    .footer {
-        text-align: center;
-        margin-top: 2rem;
-        padding-top: 1rem;
-        border-top: 1px solid #ddd;
-        color: #666;
-        font-size: 0.8rem;
-    }
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 2px;
-    }
-    .stTabs [data-baseweb="tab"] {
-        background-color: #F5F5F5;
-        border-radius: 4px 4px 0px 0px;
-        padding: 10px 20px;
-        border: none;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: #1E88E5 !important;
-        color: white !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Seconds between progress polls while an agent run is in flight
+POLL_INTERVAL = 0.3
+
+# Custom CSS for a more professional look, served once as a static file the browser caches
+st.markdown('<link rel="stylesheet" href="app/static/style.css">', unsafe_allow_html=True)
 
 # App title and description
 st.markdown('<h1 class="main-header">🔍 AI Search Assistant</h1>', unsafe_allow_html=True)
@@ -200,124 +66,258 @@ st.markdown('<h1 class="main-header">🔍 AI Search Assistant</h1>', unsafe_allo
 # Create tabs for different sections
 tabs = st.tabs(["🤖 Chat", "ℹ️ About", "🛠️ Settings"])
 
+# Example questions; one is picked per session so the input widget keeps its identity across reruns
+PLACEHOLDERS = [
+    "e.g., What are the latest developments in AI?",
+    "e.g., Tell me about recent movies in 2025",
+    "e.g., What are the best tourist spots in Japan?",
+    "e.g., How does quantum computing work?",
+    "e.g., What are the trending technologies in 2025?"
+]
+if "placeholder" not in st.session_state:
+    st.session_state.placeholder = PLACEHOLDERS[uuid.uuid4().int % len(PLACEHOLDERS)]
+
+
+def append_message(message):
+    """Save ``message`` and add it to the transcript, keeping only the latest pages in memory."""
+    message["id"] = get_conversation_store().append(st.session_state.thread_id, message)
+    messages = st.session_state.messages
+    messages.append(message)
+    # Drop whole pages so the remaining history blocks keep their boundaries
+    while len(messages) > CONVERSATION_MAX_LOADED:
+        del messages[:CONVERSATION_PAGE_SIZE]
+        st.session_state.has_older = True
+
+
+def load_older_messages():
+    """Load older messages button callback."""
+    messages = st.session_state.messages
+    older, st.session_state.has_older = get_conversation_store().page(
+        st.session_state.thread_id, before=messages[0]["id"] if messages else None
+    )
+    st.session_state.messages = older + messages
+
+
+def prefetch_searches(queries):
+    """Warm the search cache for questions this session is likely to ask next (see prefetch.py)."""
+    if PREFETCH_ENABLED:
+        get_prefetcher().schedule(
+            st.session_state.thread_id, queries, st.session_state.get("max_results", 3), st.session_state.tavily_api_key
+        )
+
+
+def prefetch_typed_query():
+    """Query input callback (Enter or leaving the field): the question is likely about to be sent."""
+    prefetch_searches([st.session_state.query_input])
+
+
+def submit_query():
+    """Search button callback: runs before the script, so the new message shows on this rerun."""
+    query = st.session_state.query_input
+    if not query or st.session_state.thinking:
+        return
+    if PREFETCH_ENABLED:
+        # Speculation that hasn't started is superseded by the real question
+        get_prefetcher().cancel(st.session_state.thread_id)
+    
+    # Add user message to chat history
+    append_message({"role": "user", "content": query})
+    
+    try:
+        # The agent libraries are imported on the first query unless already prewarmed
+        load_agent_modules()
+        from langchain_core.messages import HumanMessage
+        from memory import forget_last_turn, remember_turn, session_config
+        from routing import get_router
+        from streaming import stream_agent
+        
+        # Get model and max results from session state
+        model_name = st.session_state.get("model_name", "gpt-3.5-turbo-0125")
+        max_results = st.session_state.get("max_results", 3)
+        
+        # Reuse the compiled agent for this configuration across sessions and reruns.
+        # The session's keys are passed to it explicitly, never through os.environ
+        openai_api_key = st.session_state.openai_api_key
+        tavily_api_key = st.session_state.tavily_api_key
+        agent_for = lambda model: get_agent(model, max_results, openai_api_key, tavily_api_key, memory=True)
+        # In auto mode the router picks the model per question when the run starts
+        agent_executor = agent_for(model_name) if model_name != AUTO_MODEL else None
+        embed = openai_embedder(openai_api_key)
+        config = session_config(st.session_state.thread_id)
+        # Follow-up questions depend on the conversation so far and can't be shared
+        is_follow_up = len(st.session_state.messages) > 1
+        
+        def remember(answer):
+            # An answer served from a cache or the index never ran the agent; put the turn
+            # in the thread's memory so follow-up questions have its context
+            remember_turn(agent_executor or agent_for(get_router().fast_model), config, query, answer)
+        
+        def remember_cached(events):
+            for event in events:
+                if event["type"] == "final" and event.get("cached"):
+                    remember(event["content"])
+                yield event
+        
+        # Run the agent on the shared background pool; recurring opening questions are
+        # answered from the precomputed index, repeated or near-identical ones from the answer cache
+        def run_agent(run, query=query, namespace=f"{model_name}:{max_results}"):
+            # Timed from here, when a worker picks the run up
+            trace = Trace("app", queue_wait=run.queue_wait)
+            run_config = {**config, "callbacks": [trace.handler]}
+            
+            def stream_for(model, retry=False):
+                agent = agent_executor or agent_for(model)
+                if retry:
+                    # The escalated run asks again; drop the weak answer and its question from memory
+                    forget_last_turn(agent, config)
+                return stream_agent(agent, [HumanMessage(content=query)], config=run_config, stop=run.stop)
+            
+            if agent_executor is None:
+                stream = lambda: get_router().stream(query, stream_for)
+            else:
+                stream = lambda: stream_for(model_name)
+            if is_follow_up:
+                return traced(stream(), trace)
+            # Both lookups share one embedding of the question
+            question_embed = embed_once(embed)
+            cached = lambda: cached_stream(get_answer_cache(), query, namespace, stream, embed=question_embed)
+            return traced(remember_cached(indexed_stream(get_answer_index(), query, cached, embed=question_embed)), trace)
+        
+        st.session_state.active_run = get_run_queue().submit(run_agent)
+        st.session_state.thinking = True
+    
+    except Exception as e:
+        # Add error message to chat history
+        error_message = describe_error(e)
+        append_message({"role": "assistant", "content": error_message})
+
+
+def clear_chat():
+    """Clear button callback, stopping any run that is still in flight."""
+    if st.session_state.active_run is not None:
+        st.session_state.active_run.cancel()
+        st.session_state.active_run = None
+    # Forget the conversation and its memory, and start a new thread
+    from memory import get_checkpointer
+    get_checkpointer().delete_thread(st.session_state.thread_id)
+    get_conversation_store().delete(st.session_state.thread_id)
+    st.session_state.thread_id = uuid.uuid4().hex
+    st.query_params["conversation"] = st.session_state.thread_id
+    st.session_state.messages = []
+    st.session_state.has_older = False
+    st.session_state.thinking = False
+
+
+def collect_finished_run():
+    """Move the result of a finished background run into the chat history.
+
+    Done before the transcript is drawn, so the answer appears on the same
+    rerun that notices it instead of needing one more.
+    """
+    run = st.session_state.active_run
+    if not st.session_state.thinking or run is None or not run.finished:
+        return
+    progress = run.snapshot()
+    if progress["error"] is not None:
+        # Add error message to chat history
+        error_message = describe_error(progress["error"])
+        append_message({"role": "assistant", "content": error_message})
+    elif progress["result"] is not None:
+        # Add assistant response to chat history
+        message = {
+            "role": "assistant",
+            "content": progress["result"],
+            "sources": progress["sources"],
+            "timing": progress["timing"],
+            "route": progress["route"],
+        }
+        if progress["indexed"]:
+            # When the precomputed answer was refreshed, shown with it
+            message["indexed"] = progress["indexed"]
+        append_message(message)
+        if progress["cached"] == "index":
+            st.toast("⚡ Answered from precomputed answers")
+        elif progress["cached"]:
+            st.toast("⚡ Answered from cache")
+        if PREFETCH_ENABLED:
+            get_prefetcher().schedule_follow_ups(
+                st.session_state.thread_id,
+                st.session_state.messages[-2]["content"],
+                progress["result"],
+                st.session_state.get("max_results", 3),
+                st.session_state.openai_api_key,
+                st.session_state.tavily_api_key,
+            )
+    
+    # Turn off thinking animation
+    st.session_state.thinking = False
+    st.session_state.active_run = None
+
+
 with tabs[0]:  # Chat Tab
     if st.session_state.api_keys_valid:
         # Chat interface
         st.markdown('<h3 class="sub-header">Ask me anything</h3>', unsafe_allow_html=True)
         
         # Query input with dynamic placeholder
-        placeholders = [
-            "e.g., What are the latest developments in AI?",
-            "e.g., Tell me about recent movies in 2025",
-            "e.g., What are the best tourist spots in Japan?",
-            "e.g., How does quantum computing work?",
-            "e.g., What are the trending technologies in 2025?"
-        ]
-        import random
-        query = st.text_input("", placeholder=random.choice(placeholders), key="query_input")
+        st.text_input("", placeholder=st.session_state.placeholder, key="query_input", on_change=prefetch_typed_query)
+        
+        # The suggested example is a likely first question
+        if not st.session_state.get("placeholder_prefetched"):
+            st.session_state.placeholder_prefetched = True
+            prefetch_searches([st.session_state.placeholder.removeprefix("e.g., ")])
         
         # Buttons
         col1, col2 = st.columns([1, 5])
         with col1:
-            search_button = st.button("🔍 Search", use_container_width=True)
+            st.button("🔍 Search", use_container_width=True, on_click=submit_query)
         with col2:
-            clear_button = st.button("🗑️ Clear Chat", use_container_width=False, key="clear_button")
+            st.button("🗑️ Clear Chat", use_container_width=False, key="clear_button", on_click=clear_chat)
             st.markdown('<div class="clear-button"></div>', unsafe_allow_html=True)
         
         # Chat container
         st.markdown('<h3 class="sub-header">Conversation</h3>', unsafe_allow_html=True)
         chat_container = st.container(height=500)
         
-        # Process the query when submitted
-        if query and search_button:
-            # Add user message to chat history
-            st.session_state.messages.append({"role": "user", "content": query})
-            st.session_state.thinking = True
-            
-            # Force a rerun to show the user message immediately
-            st.experimental_rerun()
+        collect_finished_run()
         
         # Display chat messages
         with chat_container:
             if not st.session_state.messages:
                 st.info("👋 Hello! Ask me anything and I'll search the web for answers.")
             
-            for message in st.session_state.messages:
-                if message["role"] == "user":
-                    st.markdown(f"""
-                    <div class="chat-message user">
-                        <img src="https://api.dicebear.com/7.x/bottts/svg?seed=user" class="avatar" alt="user">
-                        <div class="message">{message["content"]}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""
-                    <div class="chat-message assistant">
-                        <img src="https://api.dicebear.com/7.x/bottts/svg?seed=assistant" class="avatar" alt="assistant">
-                        <div class="message">{message["content"]}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
+            # Only the latest messages are loaded; older ones are fetched on request
+            if st.session_state.has_older:
+                st.button("⬆️ Load older messages", key="load_older", on_click=load_older_messages)
+            
+            # Finished blocks render identically every rerun and aren't re-sent to the browser
+            for block in history_blocks(st.session_state.messages):
+                st.markdown(block, unsafe_allow_html=True)
             
-            # Show thinking animation
+            # Show the progress of the background run; the page polls until it finishes
             if st.session_state.thinking:
-                st.markdown(f"""
-                <div class="chat-message assistant">
-                    <img src="https://api.dicebear.com/7.x/bottts/svg?seed=assistant" class="avatar" alt="assistant">
-                    <div class="message">
-                        <p>Thinking...</p>
-                        <div class="thinking-animation">
-                            <div></div><div></div><div></div><div></div>
-                        </div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+                run = st.session_state.active_run
+                progress = run.snapshot()
                 
-                try:
-                    # Set API keys from session state
-                    os.environ["OPENAI_API_KEY"] = st.session_state.openai_api_key
-                    os.environ["TAVILY_API_KEY"] = st.session_state.tavily_api_key
-                    
-                    # Get the last user message
-                    last_user_message = next((msg["content"] for msg in reversed(st.session_state.messages) 
-                                             if msg["role"] == "user"), None)
-                    
-                    if last_user_message:
-                        # Get model and max results from session state
-                        model_name = st.session_state.get("model_name", "gpt-3.5-turbo-0125")
-                        max_results = st.session_state.get("max_results", 3)
-                        
-                        # Initialize the model and tools
-                        chat_model = ChatOpenAI(model=model_name)
-                        search = TavilySearchResults(max_results=max_results)
-                        tools = [search]
-                        
-                        # Create the agent
-                        agent_executor = create_react_agent(chat_model, tools)
-                        
-                        # Execute the agent
-                        response = agent_executor.invoke({"messages": [HumanMessage(content=last_user_message)]})
-                        
-                        # Extract the final AI response
-                        ai_message = response['messages'][-1].content
-                        
-                        # Add assistant response to chat history
-                        st.session_state.messages.append({"role": "assistant", "content": ai_message})
-                    
-                except Exception as e:
-                    # Add error message to chat history
-                    error_message = f"Sorry, I encountered an error: {str(e)}"
-                    st.session_state.messages.append({"role": "assistant", "content": error_message})
+                if progress["steps"]:
+                    with st.status("Searching the web...", expanded=False, state="running" if not progress["text"] else "complete"):
+                        for step in progress["steps"]:
+                            if step["type"] == "tool_start":
+                                st.write(f"🔍 **{step['name']}**: `{step['input']}`")
+                            elif step["type"] == "escalate":
+                                st.write(f"↗️ Asking {step['to']} instead ({step['reason']})")
+                            else:
+                                st.write(f"✅ Received {len(step['output'])} characters of results")
                 
-                # Turn off thinking animation
-                st.session_state.thinking = False
-                
-                # Force a rerun to update the chat with the response
-                st.experimental_rerun()
-        
-        # Clear conversation when button is clicked
-        if clear_button:
-            st.session_state.messages = []
-            st.experimental_rerun()
+                if progress["text"]:
+                    # Tokens received so far
+                    st.markdown(render_partial(progress["text"]), unsafe_allow_html=True)
+                else:
+                    # Show thinking animation until the first token arrives
+                    status_text = "Thinking..."
+                    if progress["status"] == "queued":
+                        status_text = f"Waiting for a free assistant (position {get_run_queue().position(run)} in queue)..."
+                    st.markdown(render_thinking(status_text), unsafe_allow_html=True)
     
     else:
         # Welcome message if API keys are not yet provided
@@ -350,7 +350,7 @@ with tabs[0]:  # Chat Tab
             <div style="padding: 20px; border-radius: 10px; border: 1px solid #ddd; height: 200px;">
                 <h4>💬 Natural Conversation</h4>
                 <p>Have a flowing conversation with follow-up questions and contextual responses.</p>
-                <p>The chat history is maintained throughout your session.</p>
+                <p>The chat history is saved, so reloading the page brings your conversation back.</p>
             </div>
             """, unsafe_allow_html=True)
             
@@ -387,6 +387,7 @@ with tabs[1]:  # About Tab
     - Your API keys are stored only in your browser's session
     - Keys are never saved to our servers
     - Each user must provide their own API keys
+    - Conversations are saved on the server so they survive a page reload; **Clear Chat** deletes them
     """)
     
     # Example use cases
@@ -473,15 +474,10 @@ with tabs[2]:  # Settings Tab
         
         with col1:
             # Model selection
-            model_options = {
-                "gpt-3.5-turbo-0125": "GPT-3.5 Turbo (Faster, Lower Cost)",
-                "gpt-4-turbo-preview": "GPT-4 Turbo (More Capable, Higher Cost)"
-            }
-            
             selected_model = st.selectbox(
                 "Select AI Model",
-                options=list(model_options.keys()),
-                format_func=lambda x: model_options[x],
+                options=list(MODEL_OPTIONS.keys()),
+                format_func=lambda x: MODEL_OPTIONS[x],
                 index=0,
                 help="GPT-4 provides better results but costs more"
             )
@@ -501,6 +497,81 @@ with tabs[2]:  # Settings Tab
             
             # Save to session state
             st.session_state.max_results = max_results
+
+        # Agent cache statistics for this server process
+        stats = agent_cache_stats()
+        st.caption(
+            f"Agent cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['size']}/{stats['maxsize']} agents cached"
+        )
+        answer_stats = get_answer_cache().stats()
+        st.caption(
+            f"Answer cache: {answer_stats['exact_hits']} exact and {answer_stats['semantic_hits']} similar hits, "
+            f"{answer_stats['misses']} misses, {answer_stats['size']}/{answer_stats['maxsize']} answers stored"
+        )
+        # The search cache is opened with the first agent
+        search_stats = get_metrics().read_stats("search_cache")
+        if search_stats is not None:
+            st.caption(
+                f"Search cache: {search_stats['hits']} hits ({search_stats['prefetch_hits']} prefetched), "
+                f"{search_stats['misses']} misses, {search_stats['coalesced']} duplicate requests coalesced"
+            )
+        if PREFETCH_ENABLED:
+            prefetch_stats = get_prefetcher().stats()
+            st.caption(
+                f"Search prefetch: {prefetch_stats['fetched']} searches run ahead, {prefetch_stats['cancelled']} cancelled, "
+                f"{prefetch_stats['over_budget']} skipped over budget"
+            )
+        index_stats = get_metrics().read_stats("answer_index")
+        if index_stats is not None:
+            st.caption(
+                f"Precomputed answers: {index_stats['answered']}/{index_stats['size']} questions answered, "
+                f"{index_stats['exact_hits'] + index_stats['semantic_hits']} served, "
+                f"{index_stats['refreshed']} refreshed and {index_stats['failed']} failed refreshes by this process"
+            )
+        queue_stats = get_run_queue().stats()
+        st.caption(
+            f"Agent workers: {queue_stats['running']}/{queue_stats['max_workers']} busy, "
+            f"{queue_stats['queued']}/{queue_stats['max_queued']} queued"
+        )
+        conversation_stats = get_conversation_store().stats()
+        if conversation_stats:
+            st.caption(
+                f"Conversation store: {conversation_stats['appended']} messages saved, "
+                f"{conversation_stats['pages_loaded']} pages of history loaded"
+            )
+        route_stats = get_metrics().read_stats("routing")
+        if route_stats is not None:
+            st.caption(
+                f"Auto model routing: {route_stats['fast']} questions to the fast model, "
+                f"{route_stats['capable']} to the capable model, {route_stats['escalations']} escalated"
+            )
+        if import_times:
+            st.caption(
+                f"Agent libraries loaded in {sum(import_times.values()):.1f}s ("
+                + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in import_times.items())
+                + ")"
+            )
+        
+        # Where the time went for each answer in this conversation
+        if st.checkbox("Show response timing breakdown", key="show_timings"):
+            timings = [
+                {
+                    "question": question["content"][:60],
+                    "model": (message.get("route") or {}).get("model", ""),
+                    **message["timing"],
+                }
+                for question, message in zip(st.session_state.messages, st.session_state.messages[1:])
+                if message["role"] == "assistant" and message.get("timing")
+            ]
+            if timings:
+                st.markdown(timing_table(timings))
+                st.caption(
+                    "Seconds spent waiting for a worker, until the first token, in LLM calls, "
+                    "in web searches and in everything else (graph and caches)."
+                )
+            else:
+                st.caption("No timed answers in this conversation yet.")
     
     # Information section
     st.markdown('<h3 class="sub-header">How to Get API Keys</h3>', unsafe_allow_html=True)
@@ -548,4 +619,16 @@ st.markdown("""
 <div class="footer">
     <p>Built with ❤️ using Streamlit, LangChain and OpenAI | © 2025 AI Search Assistant (Made by Mahfujul Karim) </p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+observe_render(time.perf_counter() - script_started)
+
+# The page has been sent; load the agent libraries before the first query needs them
+prewarm_agent_modules()
+
+# Poll the background run only once every tab and the footer are on the page:
+# keep the script thread free between polls so the page stays responsive,
+# then rerun to show new progress or the final response
+if st.session_state.thinking:
+    time.sleep(POLL_INTERVAL)
+    st.rerun()
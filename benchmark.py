@@ -0,0 +1,167 @@
+"""Offline benchmark of the agent pipeline.
+
+Runs the real search agent graph (tool node, memory, search cache,
+streaming) against the local fakes in :mod:`fakes`, so it needs no API keys
+or network. Every scenario starts ``sessions`` conversations of ``turns``
+questions each, with ``concurrency`` of them in flight at once, and reports
+latency percentiles, time to first token, throughput and peak memory.
+
+Peak RSS is always reported. Python allocation peaks per scenario need
+``--trace-alloc``, which slows every allocation down, so don't compare its
+latencies with untraced runs.
+
+    python benchmark.py                          # default scenario grid
+    python benchmark.py --concurrency 1 8 --turns 1 5 --json results.json
+    python benchmark.py --baseline results.json  # exit 1 on a p95 regression
+"""
+import argparse
+import json
+import math
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+from langchain_core.messages import HumanMessage
+
+from fakes import FakeChatModel, fake_search_tool
+from memory import BoundedMemorySaver, session_config
+from react_graph import create_search_agent
+from streaming import stream_agent
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` (``q`` in 0-100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _ask(agent, question, config):
+    started = time.perf_counter()
+    first_token = None
+    for event in stream_agent(agent, [HumanMessage(content=question)], config=config):
+        if event["type"] == "token" and first_token is None:
+            first_token = time.perf_counter() - started
+    return time.perf_counter() - started, first_token
+
+
+def run_scenario(concurrency, turns, max_results, sessions, fake, trace_alloc=False):
+    """Run one scenario and return its measurements."""
+    model = FakeChatModel(
+        first_token_latency=fake["llm_latency"],
+        token_latency=fake["token_latency"],
+        answer_tokens=fake["answer_tokens"],
+        tool_calls_per_step=fake["tool_calls"],
+    )
+    search = fake_search_tool(max_results, latency=fake["search_latency"], result_chars=fake["result_chars"])
+    checkpointer = BoundedMemorySaver(max_threads=sessions) if turns > 1 else None
+    agent = create_search_agent(model, [search], checkpointer=checkpointer)
+
+    def conversation(session):
+        config = session_config(f"bench-{session}") if checkpointer else None
+        return [_ask(agent, f"question {turn} of session {session}", config) for turn in range(turns)]
+
+    if trace_alloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [timing for timings in pool.map(conversation, range(sessions)) for timing in timings]
+    elapsed = time.perf_counter() - started
+    peak = None
+    if trace_alloc:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies = [latency for latency, _ in results]
+    first_tokens = [first for _, first in results if first is not None]
+    return {
+        "scenario": f"c{concurrency}-t{turns}-r{max_results}",
+        "concurrency": concurrency,
+        "turns": turns,
+        "max_results": max_results,
+        "requests": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "first_token_p50": percentile(first_tokens, 50),
+        "throughput": len(latencies) / elapsed,
+        "peak_alloc_mb": peak / 2**20 if peak is not None else None,
+        # ru_maxrss is in KiB on Linux; it only ever grows over the process
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_report(results, output=sys.stdout):
+    header = f"{'scenario':<14}{'reqs':>6}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'ttft s':>9}{'req/s':>9}{'alloc MB':>10}{'rss MB':>9}"
+    print(header, file=output)
+    print("-" * len(header), file=output)
+    for r in results:
+        print(
+            f"{r['scenario']:<14}{r['requests']:>6}{r['p50']:>9.3f}{r['p95']:>9.3f}{r['p99']:>9.3f}"
+            f"{r['first_token_p50'] or 0:>9.3f}{r['throughput']:>9.1f}"
+            f"{'-' if r['peak_alloc_mb'] is None else format(r['peak_alloc_mb'], '.1f'):>10}{r['peak_rss_mb']:>9.1f}",
+            file=output,
+        )
+
+
+def compare(results, baseline, tolerance):
+    """Return a message per scenario whose p95 latency regressed by more than ``tolerance``."""
+    previous = {r["scenario"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get(r["scenario"])
+        if before and r["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: p95 {before['p95']:.3f}s -> {r['p95']:.3f}s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the search agent offline with simulated OpenAI and Tavily.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="conversations in flight at once")
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 4], help="questions per conversation")
+    parser.add_argument("--max-results", type=int, nargs="+", default=[3, 10], help="search results per query")
+    parser.add_argument("--sessions", type=int, default=32, help="conversations per scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds before a simulated LLM's first token")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds between simulated tokens")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="tokens in each simulated answer")
+    parser.add_argument("--tool-calls", type=int, default=1, help="searches the simulated LLM requests per step")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="seconds per simulated search")
+    parser.add_argument("--result-chars", type=int, default=500, help="characters per simulated search result")
+    parser.add_argument("--trace-alloc", action="store_true", help="measure peak Python allocations per scenario (slower)")
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    fake = {
+        "llm_latency": args.llm_latency,
+        "token_latency": args.token_latency,
+        "answer_tokens": args.answer_tokens,
+        "tool_calls": args.tool_calls,
+        "search_latency": args.search_latency,
+        "result_chars": args.result_chars,
+    }
+    results = []
+    for concurrency, turns, max_results in product(args.concurrency, args.turns, args.max_results):
+        results.append(run_scenario(concurrency, turns, max_results, args.sessions, fake, args.trace_alloc))
+        print(f"finished {results[-1]['scenario']}", file=sys.stderr, flush=True)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
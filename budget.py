@@ -0,0 +1,99 @@
+"""Per-question limits on the agent's search loop.
+
+Without them a question that keeps the model searching runs until the
+graph's recursion limit. :class:`RunBudget` caps the model steps, tool
+calls, tokens and wall time spent on one question; once a limit is reached
+the graph stops searching and the model answers from the results it has
+(see ``react_graph``). Limits are checked before each model step, so a
+tool step in progress finishes first (it has its own ``TOOL_TIMEOUT``).
+
+Cutoffs are counted in the ``agent_budget_cutoffs_total`` metric and
+reported as ``cutoff`` in the final event and its timing.
+"""
+import os
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from memory import estimate_tokens
+from sources import _turn
+from telemetry import get_metrics
+
+# Agent budget settings (per question; 0 disables a limit)
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "5"))
+AGENT_MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "8"))
+AGENT_MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", "30000"))
+AGENT_MAX_SECONDS = float(os.getenv("AGENT_MAX_SECONDS", "45"))
+
+WRAP_UP_PROMPT = (
+    "You cannot search any further for this question. Answer the user's last question now, "
+    "using only the information gathered above. If it is incomplete, say briefly what is missing."
+)
+
+
+def _tokens(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens", 0)
+    return estimate_tokens([message])
+
+
+class RunBudget:
+    """Limits for one question; :meth:`exceeded` names the first one reached."""
+
+    def __init__(self, max_steps=AGENT_MAX_STEPS, max_tool_calls=AGENT_MAX_TOOL_CALLS,
+                 max_tokens=AGENT_MAX_TOKENS, max_seconds=AGENT_MAX_SECONDS):
+        self.max_steps = max_steps
+        self.max_tool_calls = max_tool_calls
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+
+    def started(self, state):
+        """When the current question's first model step began (now, if this is it)."""
+        messages = state["messages"]
+        if messages and not isinstance(messages[-1], HumanMessage) and state.get("turn_started"):
+            return state["turn_started"]
+        return time.time()
+
+    def usage(self, state, started):
+        """Steps, tool calls, tokens and seconds spent on the current question."""
+        replies = [m for m in _turn(state["messages"]) if isinstance(m, AIMessage)]
+        return {
+            "steps": len(replies),
+            "tool_calls": sum(len(m.tool_calls) for m in replies),
+            "tokens": sum(_tokens(m) for m in replies),
+            "seconds": time.time() - started,
+        }
+
+    def exceeded(self, usage):
+        limits = (
+            ("steps", self.max_steps),
+            ("tool_calls", self.max_tool_calls),
+            ("tokens", self.max_tokens),
+            ("time", self.max_seconds),
+        )
+        for name, limit in limits:
+            used = usage["seconds" if name == "time" else name]
+            if limit and used >= limit:
+                return name
+        return None
+
+    def allow_tool_calls(self, response, usage):
+        """``response`` with its tool calls cut to what is left of the allowance."""
+        if not self.max_tool_calls:
+            return response
+        left = self.max_tool_calls - usage["tool_calls"]
+        if len(response.tool_calls) <= left:
+            return response
+        return response.copy(update={"tool_calls": response.tool_calls[:left]})
+
+
+def wrap_up_prompt(messages):
+    """``messages`` (the model's prompt) with the instruction to answer without searching."""
+    return list(messages) + [SystemMessage(content=WRAP_UP_PROMPT)]
+
+
+def cut_off(response, limit):
+    """The wrap-up ``response`` marked with the limit that ended the question, which is recorded."""
+    get_metrics().inc("agent_budget_cutoffs_total", limit=limit)
+    return response.copy(update={"response_metadata": {**response.response_metadata, "budget_cutoff": limit}})
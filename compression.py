@@ -0,0 +1,115 @@
+"""Compress search results before they enter the model context.
+
+Tavily returns whole page extracts; pasting them raw makes prompt size (and
+latency) grow with ``max_results``. :func:`compress_results` drops
+near-duplicate snippets, splits the rest into passages, ranks the passages
+against the query with BM25 and keeps the best ones within a token budget.
+Everything runs locally in a few milliseconds.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+from memory import estimate_text_tokens
+
+# Search context settings
+SEARCH_CONTEXT_TOKENS = int(os.getenv("SEARCH_CONTEXT_TOKENS", "1200"))  # per search call; 0 disables compression
+SEARCH_PASSAGE_WORDS = int(os.getenv("SEARCH_PASSAGE_WORDS", "80"))
+SEARCH_DUPLICATE_SIMILARITY = float(os.getenv("SEARCH_DUPLICATE_SIMILARITY", "0.8"))
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _terms(text):
+    return _WORD.findall(text.lower())
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def split_passages(text, words=SEARCH_PASSAGE_WORDS):
+    """Split ``text`` into passages of about ``words`` words on sentence boundaries."""
+    passages, current, size = [], [], 0
+    for sentence in _SENTENCE_END.split(text.strip()):
+        length = len(sentence.split())
+        if current and size + length > words:
+            passages.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += length
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def bm25_scores(query, documents, k1=1.5, b=0.75):
+    """BM25 score of each tokenized document (a list of terms) for ``query``."""
+    if not documents:
+        return []
+    average = sum(len(d) for d in documents) / len(documents) or 1
+    frequency = Counter(term for d in documents for term in set(d))
+    query_terms = set(_terms(query))
+    scores = []
+    for document in documents:
+        counts = Counter(document)
+        score = 0.0
+        for term in query_terms:
+            if term not in counts:
+                continue
+            idf = math.log(1 + (len(documents) - frequency[term] + 0.5) / (frequency[term] + 0.5))
+            tf = counts[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(document) / average))
+        scores.append(score)
+    return scores
+
+
+def compress_results(query, results, budget=SEARCH_CONTEXT_TOKENS,
+                     passage_words=SEARCH_PASSAGE_WORDS, similarity=SEARCH_DUPLICATE_SIMILARITY):
+    """Return ``results`` (Tavily ``url``/``content`` dicts) reduced to the passages most relevant to ``query``.
+
+    Results keep their shape; each keeps only its selected passages (in their
+    original order), and results without any are dropped. The best passage is
+    always kept, even when it alone exceeds ``budget``.
+    """
+    if budget <= 0 or not results:
+        return results
+
+    # Chunk every result, skipping passages that repeat one already seen
+    passages = []
+    seen = []
+    for rank, result in enumerate(results):
+        for position, text in enumerate(split_passages(str(result.get("content", "")), passage_words)):
+            terms = _terms(text)
+            term_set = set(terms)
+            if not terms or any(_jaccard(term_set, other) >= similarity for other in seen):
+                continue
+            seen.append(term_set)
+            passages.append({"rank": rank, "position": position, "text": text, "terms": terms})
+
+    scores = bm25_scores(query, [p["terms"] for p in passages])
+    # Ties (e.g. no query term anywhere) keep the search engine's order
+    order = sorted(range(len(passages)), key=lambda i: (-scores[i], passages[i]["rank"], passages[i]["position"]))
+    selected, used = [], 0
+    for i in order:
+        cost = estimate_text_tokens(passages[i]["text"])
+        if selected and used + cost > budget:
+            continue
+        selected.append(i)
+        used += cost
+
+    best = {}
+    by_result = {}
+    for i in selected:
+        rank = passages[i]["rank"]
+        best[rank] = max(best.get(rank, 0.0), scores[i])
+        by_result.setdefault(rank, []).append(passages[i])
+    compressed = []
+    for rank in sorted(by_result, key=lambda r: (-best[r], r)):
+        chosen = sorted(by_result[rank], key=lambda p: p["position"])
+        compressed.append({**results[rank], "content": " ... ".join(p["text"] for p in chosen)})
+    return compressed
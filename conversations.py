@@ -0,0 +1,169 @@
+"""Persistent chat transcripts.
+
+The app keeps only the latest pages of a conversation in session state and
+loads older messages on request (:meth:`ConversationStore.page`), so a long
+conversation costs a bounded amount of memory per session. The conversation
+id doubles as the agent's thread id and is kept in the page URL, so a
+reload, a restart or a reconnect to another worker restores the transcript.
+
+:class:`SQLiteConversationStore` is the default; workers on one host can
+share its file. Another backend implements :class:`ConversationStore` and is
+selected with ``CONVERSATION_STORE=module:ClassName``.
+"""
+import abc
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from telemetry import get_metrics
+
+# Conversation store settings
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "")  # "module:ClassName"; empty uses SQLite
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.sqlite3")
+CONVERSATION_PAGE_SIZE = int(os.getenv("CONVERSATION_PAGE_SIZE", "20"))
+CONVERSATION_MAX_LOADED = int(os.getenv("CONVERSATION_MAX_LOADED", "100"))
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "2592000"))  # seconds idle; 0 keeps conversations forever
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation_id, id);
+"""
+
+
+class ConversationStore(abc.ABC):
+    """Interface of conversation backends; implementations must be thread-safe.
+
+    Messages are the app's ``{"role", "content", ...}`` dicts. Stores return
+    them with the ``id`` they were given by :meth:`append`; ids grow with
+    every message, and :meth:`page` uses them as its cursor.
+    """
+
+    @abc.abstractmethod
+    def append(self, conversation_id, message):
+        """Store ``message`` as the newest of the conversation and return its id."""
+
+    @abc.abstractmethod
+    def page(self, conversation_id, before=None, limit=CONVERSATION_PAGE_SIZE):
+        """Return ``(messages, has_older)``: up to ``limit`` messages older than id ``before``, oldest first.
+
+        Without ``before`` the newest messages are returned.
+        """
+
+    @abc.abstractmethod
+    def exists(self, conversation_id):
+        """Whether the conversation is stored."""
+
+    @abc.abstractmethod
+    def delete(self, conversation_id):
+        """Remove the conversation and all its messages."""
+
+    def stats(self):
+        return {}
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversations in a SQLite file, which every worker process on the host may open."""
+
+    def __init__(self, path=CONVERSATION_DB_PATH, ttl=CONVERSATION_TTL):
+        self.ttl = ttl
+        self.appended = 0
+        self.pages_loaded = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        # Readers don't block the writer, so several workers can share the file
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def append(self, conversation_id, message):
+        now = time.time()
+        extra = {k: v for k, v in message.items() if k not in ("id", "role", "content")}
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO conversations VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at",
+                (conversation_id, now, now),
+            )
+            cursor = self._db.execute(
+                "INSERT INTO messages (conversation_id, role, content, extra, created_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    conversation_id,
+                    message["role"],
+                    message["content"],
+                    json.dumps(extra, separators=(",", ":")) if extra else None,
+                    now,
+                ),
+            )
+            if self.ttl > 0:
+                self._expire(now)
+            self._db.commit()
+            self.appended += 1
+            return cursor.lastrowid
+
+    def page(self, conversation_id, before=None, limit=CONVERSATION_PAGE_SIZE):
+        # One row more than asked for tells whether there are older messages
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, role, content, extra FROM messages WHERE conversation_id = ? AND id < ? "
+                "ORDER BY id DESC LIMIT ?",
+                (conversation_id, before if before is not None else 2**63 - 1, limit + 1),
+            ).fetchall()
+            self.pages_loaded += 1
+        messages = [
+            {"id": id_, "role": role, "content": content, **(json.loads(extra) if extra else {})}
+            for id_, role, content, extra in reversed(rows[:limit])
+        ]
+        return messages, len(rows) > limit
+
+    def exists(self, conversation_id):
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"appended": self.appended, "pages_loaded": self.pages_loaded}
+
+    def _expire(self, now):
+        expired = "SELECT id FROM conversations WHERE updated_at < ?"
+        self._db.execute(f"DELETE FROM messages WHERE conversation_id IN ({expired})", (now - self.ttl,))
+        self._db.execute("DELETE FROM conversations WHERE updated_at < ?", (now - self.ttl,))
+
+
+def _load_store(spec):
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Return the process-wide conversation store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = _load_store(CONVERSATION_STORE) if CONVERSATION_STORE else SQLiteConversationStore()
+            get_metrics().add_stats("conversations", _store.stats)
+        return _store
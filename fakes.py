@@ -0,0 +1,138 @@
+"""Deterministic offline stand-ins for ChatOpenAI and Tavily search.
+
+Used by ``benchmark.py`` to exercise the real agent graph (tool node,
+memory, caches, streaming) with configurable latency and output size and no
+network access.
+"""
+import asyncio
+import random
+import time
+import zlib
+
+from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from memory import estimate_tokens
+from search_cache import CachedTavilySearchResults, SearchResultCache
+
+_VOCABULARY = (
+    "release film studio director review box office audience festival streaming series "
+    "award critic sequel trailer premiere cast budget season market report analysis data "
+    "growth model research launch update source interview schedule ranking"
+).split()
+
+
+def _question(messages):
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return str(message.content)
+    return ""
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that searches once per question and then answers with ``answer_tokens`` tokens.
+
+    Latency is ``first_token_latency`` before the first token and
+    ``token_latency`` per token after it; token callbacks fire like a
+    streaming ``ChatOpenAI``.
+    """
+
+    first_token_latency: float = 0.05
+    token_latency: float = 0.002
+    answer_tokens: int = 60
+    tool_calls_per_step: int = 1
+    tools_bound: bool = False
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return type(self)(
+            first_token_latency=self.first_token_latency,
+            token_latency=self.token_latency,
+            answer_tokens=self.answer_tokens,
+            tool_calls_per_step=self.tool_calls_per_step,
+            tools_bound=bool(tools),
+        )
+
+    def _respond(self, messages):
+        question = _question(messages)
+        searched = isinstance(messages[-1], ToolMessage)
+        usage = {"input_tokens": estimate_tokens(messages)}
+        if self.tools_bound and not searched:
+            calls = [
+                {"name": "tavily_search_results_json", "args": {"query": f"{question} ({i + 1})"}, "id": f"call_{i}"}
+                for i in range(self.tool_calls_per_step)
+            ]
+            usage.update(output_tokens=8 * len(calls), total_tokens=usage["input_tokens"] + 8 * len(calls))
+            return AIMessage(content="", tool_calls=calls, usage_metadata=usage), []
+        tokens = [f"word{i} " for i in range(self.answer_tokens)]
+        usage.update(output_tokens=len(tokens), total_tokens=usage["input_tokens"] + len(tokens))
+        return AIMessage(content="".join(tokens), usage_metadata=usage), tokens
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, tokens = self._respond(messages)
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, tokens = self._respond(messages)
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class FakeSearchResults(CachedTavilySearchResults):
+    """The app's cached search tool with Tavily replaced by generated results.
+
+    Each upstream search takes ``latency`` seconds and returns
+    ``max_results`` results of ``result_chars`` characters.
+    """
+
+    latency: float = 0.1
+    result_chars: int = 500
+
+    def _results(self, query):
+        seed = zlib.crc32(query.encode())
+        results = []
+        for i in range(self.max_results):
+            # Seeded per query and rank: varied enough to rank, identical across runs
+            rng = random.Random(seed + i)
+            words = query.split() + _VOCABULARY
+            sentences = []
+            while sum(len(s) for s in sentences) < self.result_chars:
+                sentences.append(" ".join(rng.choice(words) for _ in range(12)).capitalize() + ".")
+            results.append({"url": f"https://example.com/{seed % 10000}/{i}", "content": " ".join(sentences)})
+        return results
+
+    def _search(self, query):
+        time.sleep(self.latency)
+        return self._results(query)
+
+    async def _asearch(self, query):
+        await asyncio.sleep(self.latency)
+        return self._results(query)
+
+
+def fake_search_tool(max_results=3, latency=0.1, result_chars=500, cache=None):
+    """A :class:`FakeSearchResults` with its own in-memory cache unless ``cache`` is given."""
+    return FakeSearchResults(
+        max_results=max_results,
+        latency=latency,
+        result_chars=result_chars,
+        cache=cache or SearchResultCache(path=":memory:"),
+        # The wrapper validates that a key is set but is never called
+        api_wrapper=TavilySearchAPIWrapper(tavily_api_key="offline"),
+    )
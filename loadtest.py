@@ -0,0 +1,279 @@
+"""Load test of the Streamlit app with simulated users.
+
+Drives ``app.py`` headlessly through Streamlit's testing API: every
+simulated user is its own session that enters a question, clicks Search and
+keeps rerunning (as the browser does while the answer is polled) until the
+answer is in the transcript. The agent runs on the app's real run queue and
+graph, with the OpenAI and Tavily stand-ins from :mod:`fakes`, so it needs no
+API keys or network.
+
+Concurrency is ramped through ``--levels``. Each level reports answer
+latency percentiles, time spent queued for an agent worker, throughput and
+memory growth per session. The saturation point is the first level where
+throughput stops growing or p95 latency exceeds ``--slowdown`` times that of
+the first level.
+
+    python loadtest.py                           # 1, 2, 4, 8 and 16 users
+    python loadtest.py --levels 4 16 32 --questions 2 --json load.json
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Keep the load test's answers and transcripts out of the app's files; set
+# before the app modules read their settings
+os.environ.setdefault("ANSWER_CACHE_PATH", ":memory:")
+os.environ.setdefault("CONVERSATION_DB_PATH", ":memory:")
+os.environ.setdefault("PREFETCH_ENABLED", "0")
+
+import streamlit.testing.v1.app_test as app_test  # noqa: E402
+from streamlit.runtime import Runtime  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import agent_factory  # noqa: E402
+import response_cache  # noqa: E402
+from benchmark import percentile  # noqa: E402
+from fakes import FakeChatModel, fake_search_tool  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def install_fakes(fake):
+    """Make the app build its agents from the simulated model and search tool."""
+    from memory import get_checkpointer
+    from react_graph import create_search_agent
+    from search_cache import SearchResultCache
+
+    # One cache for every session, as in the app
+    cache = SearchResultCache(path=":memory:")
+
+    def build_agent(model_name, max_results, openai_api_key, tavily_api_key, memory=False):
+        model = FakeChatModel(
+            first_token_latency=fake["llm_latency"],
+            token_latency=fake["token_latency"],
+            answer_tokens=fake["answer_tokens"],
+            tool_calls_per_step=fake["tool_calls"],
+        )
+        search = fake_search_tool(max_results, latency=fake["search_latency"],
+                                  result_chars=fake["result_chars"], cache=cache)
+        return create_search_agent(model, [search], checkpointer=get_checkpointer() if memory else None)
+
+    agent_factory.build_agent = build_agent
+    agent_factory.clear_agent_cache()
+    # The answer cache's similarity tier would call OpenAI
+    response_cache.openai_embedder = lambda api_key, model=None: None
+
+
+class _KeptRuntime:
+    # Runtime as seen by AppTest, except that clearing the singleton is ignored
+    def __getattr__(self, name):
+        return getattr(Runtime, name)
+
+    def __setattr__(self, name, value):
+        if name != "_instance" or value is not None:
+            setattr(Runtime, name, value)
+
+    def __dir__(self):
+        return dir(Runtime)
+
+
+@contextmanager
+def overlapping_app_tests():
+    """Let AppTest script runs in several threads overlap.
+
+    Each AppTest run installs a mock ``Runtime`` singleton and clears it when
+    it ends, which breaks the runs still going in other threads. Inside this
+    block the singleton is left in place (any run's mock serves them all).
+    """
+    app_test.Runtime = _KeptRuntime()
+    try:
+        yield
+    finally:
+        app_test.Runtime = Runtime
+        Runtime._instance = None
+
+
+def _rss_mb():
+    # Current resident memory; falls back to the peak where /proc isn't available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rerun(at, timeout):
+    # AppTest can't send back the value of a selectbox with format_func (the
+    # model picker), so keep it on its default option
+    for box in at.selectbox:
+        box.select_index(box.proto.default)
+    at.run(timeout=timeout)
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+
+class SimulatedUser:
+    """One browser session asking ``questions`` questions in a row."""
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.at.session_state.openai_api_key = "offline"
+        self.at.session_state.tavily_api_key = "offline"
+        self.at.session_state.api_keys_valid = True
+        self.script_runs = 0
+
+    def ask(self, question):
+        """Submit ``question`` and rerun until its answer is shown; returns (seconds, queue wait)."""
+        at = self.at
+        if not self.script_runs:
+            _rerun(at, self.timeout)
+            self.script_runs += 1
+        started = time.perf_counter()
+        at.text_input(key="query_input").input(question)
+        at.button[0].click()
+        _rerun(at, self.timeout)
+        self.script_runs += 1
+        while at.session_state.thinking:
+            if time.perf_counter() - started > self.timeout:
+                raise TimeoutError(f"{self.name}: no answer after {self.timeout}s")
+            _rerun(at, self.timeout)
+            self.script_runs += 1
+        elapsed = time.perf_counter() - started
+        answer = at.session_state.messages[-1]
+        if answer["role"] != "assistant" or "timing" not in answer:
+            raise RuntimeError(f"{self.name}: {answer['content']}")
+        return elapsed, answer["timing"]["queue_wait"]
+
+
+def run_level(users, questions, timeout):
+    """Run ``users`` concurrent sessions of ``questions`` questions and return the measurements."""
+    gc.collect()
+    rss_before = _rss_mb()
+    sessions = []
+    sessions_lock = threading.Lock()
+    errors = []
+    level_id = uuid.uuid4().hex[:6]
+
+    def session(n):
+        user = SimulatedUser(f"user-{n}", timeout)
+        with sessions_lock:
+            sessions.append(user)
+        results = []
+        for turn in range(questions):
+            try:
+                # Unique first questions, so the answer cache doesn't serve them
+                results.append(user.ask(f"load test question {turn} from session {level_id}-{n}"))
+            except Exception as e:
+                errors.append(f"{user.name}: {e}")
+                break
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        results = [r for rs in pool.map(session, range(users)) for r in rs]
+    elapsed = time.perf_counter() - started
+    # Measured while every session of the level is still alive
+    rss_after = _rss_mb()
+
+    latencies = [latency for latency, _ in results]
+    queue_waits = [wait for _, wait in results]
+    return {
+        "users": users,
+        "answers": len(results),
+        "errors": len(errors),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "queue_p95": percentile(queue_waits, 95),
+        "throughput": len(results) / elapsed,
+        "script_runs": sum(s.script_runs for s in sessions),
+        "rss_mb": rss_after,
+        "rss_per_session_mb": max(rss_after - rss_before, 0.0) / users,
+        "error_samples": errors[:3],
+    }
+
+
+def saturation_point(results, slowdown):
+    """The first level whose throughput didn't grow, or whose p95 exceeds ``slowdown`` times the first level's."""
+    best = 0.0
+    baseline = results[0]["p95"] if results and results[0]["p95"] else None
+    for r in results:
+        if r["answers"] == 0:
+            return r["users"]
+        too_slow = baseline is not None and r["p95"] > baseline * slowdown
+        if too_slow or (best and r["throughput"] < best * 1.1):
+            return r["users"]
+        best = max(best, r["throughput"])
+    return None
+
+
+def print_report(results, output=sys.stdout):
+    header = f"{'users':>6}{'answers':>9}{'errors':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'queue s':>9}{'ans/s':>8}{'runs':>7}{'rss MB':>9}{'MB/user':>9}"
+    print(header, file=output)
+    print("-" * len(header), file=output)
+    for r in results:
+        if not r["answers"]:
+            print(f"{r['users']:>6}{0:>9}{r['errors']:>8}", file=output)
+            continue
+        print(
+            f"{r['users']:>6}{r['answers']:>9}{r['errors']:>8}{r['p50']:>9.3f}{r['p95']:>9.3f}{r['p99']:>9.3f}"
+            f"{r['queue_p95']:>9.3f}{r['throughput']:>8.2f}{r['script_runs']:>7}{r['rss_mb']:>9.1f}{r['rss_per_session_mb']:>9.2f}",
+            file=output,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Streamlit app with simulated concurrent users.")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="concurrent users per step of the ramp")
+    parser.add_argument("--questions", type=int, default=2, help="questions each user asks")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds a user waits for an answer before giving up")
+    parser.add_argument("--slowdown", type=float, default=2.0, help="p95 latency, relative to the first level, that counts as saturated")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds before a simulated LLM's first token")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds between simulated tokens")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="tokens in each simulated answer")
+    parser.add_argument("--tool-calls", type=int, default=1, help="searches the simulated LLM requests per step")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="seconds per simulated search")
+    parser.add_argument("--result-chars", type=int, default=500, help="characters per simulated search result")
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    install_fakes({
+        "llm_latency": args.llm_latency,
+        "token_latency": args.token_latency,
+        "answer_tokens": args.answer_tokens,
+        "tool_calls": args.tool_calls,
+        "search_latency": args.search_latency,
+        "result_chars": args.result_chars,
+    })
+    results = []
+    with overlapping_app_tests():
+        for users in args.levels:
+            results.append(run_level(users, args.questions, args.timeout))
+            print(f"finished {users} users", file=sys.stderr, flush=True)
+            for error in results[-1]["error_samples"]:
+                print(f"  error: {error}", file=sys.stderr)
+    print_report(results)
+
+    saturated = saturation_point(results, args.slowdown)
+    if saturated is None:
+        print(f"\nNo saturation up to {args.levels[-1]} concurrent users.")
+    else:
+        print(f"\nSaturated at {saturated} concurrent users (throughput flat or p95 over {args.slowdown:g}x).")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results, "saturated_at": saturated}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
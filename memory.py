@@ -0,0 +1,219 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Annotated, Sequence, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint import MemorySaver
+from langgraph.graph.message import add_messages
+from langgraph.managed.base import ManagedValue
+
+from streaming import SILENT_TAG
+
+# Conversation memory settings
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "500"))
+
+SUMMARY_PROMPT = (
+    "Condense the conversation below into a short summary for an assistant that will answer "
+    "follow-up questions. Keep facts, names, dates, numbers and any open questions; drop "
+    "pleasantries and raw search output."
+)
+
+
+class RemainingStepsManager(ManagedValue[int]):
+    # Graph steps left before the run hits its recursion limit, counting the current one
+    def __call__(self, step, task):
+        return self.config["recursion_limit"] - step
+
+
+RemainingSteps = Annotated[int, RemainingStepsManager]
+
+
+class ConversationState(TypedDict):
+    """Agent state with a rolling summary of the turns no longer kept verbatim."""
+
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+    remaining_steps: RemainingSteps
+    summary: str
+    # When the current question's first model step started (see budget.RunBudget)
+    turn_started: float
+
+
+def estimate_text_tokens(text):
+    """Cheap local token estimate for ``text`` (~4 characters per token)."""
+    return len(text) // 4
+
+
+def estimate_tokens(messages):
+    """Cheap local token estimate for ``messages`` (see :func:`estimate_text_tokens`) plus per-message overhead."""
+    total = 0
+    for message in messages:
+        total += 4 + estimate_text_tokens(str(message.content))
+        for call in getattr(message, "tool_calls", None) or []:
+            total += estimate_text_tokens(str(call.get("args", "")))
+    return total
+
+
+def _turn_starts(messages):
+    # A turn starts at a user message; cutting anywhere else could separate a
+    # tool call from its result, which the API rejects
+    return [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+
+
+def window_messages(messages, budget=MEMORY_TOKEN_BUDGET):
+    """Return the most recent whole turns that fit in ``budget`` tokens.
+
+    The latest turn is always kept, even if it alone exceeds the budget.
+    """
+    starts = _turn_starts(messages)
+    if not starts:
+        return list(messages)
+    keep_from = starts[-1]
+    for start in reversed(starts[:-1]):
+        if estimate_tokens(messages[start:]) > budget:
+            break
+        keep_from = start
+    return list(messages[keep_from:])
+
+
+def conversation_prompt(state, budget=MEMORY_TOKEN_BUDGET):
+    """Messages sent to the model: the rolling summary plus a token-budgeted window."""
+    messages = window_messages(state["messages"], budget)
+    if state.get("summary"):
+        messages = [SystemMessage(content=f"Summary of the earlier conversation:\n{state['summary']}")] + messages
+    return messages
+
+
+def _transcript(messages):
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {message.content}")
+        elif isinstance(message, AIMessage) and message.content:
+            lines.append(f"Assistant: {message.content}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Search results: {str(message.content)[:500]}")
+    return "\n".join(lines)
+
+
+def messages_to_fold(state, budget=MEMORY_TOKEN_BUDGET):
+    """Oldest messages to fold into the summary, or an empty list while history fits ``budget``.
+
+    Folding stops when the verbatim history is down to about half the budget,
+    so the summary is refreshed every few turns rather than on every question.
+    """
+    messages = state["messages"]
+    if estimate_tokens(messages) <= budget:
+        return []
+    recent = window_messages(messages, budget // 2)
+    return list(messages[:len(messages) - len(recent)])
+
+
+def needs_summary(state):
+    return "summarize" if messages_to_fold(state) else "agent"
+
+
+def make_summarize_node(model):
+    """Graph node folding the oldest turns into the rolling ``summary``."""
+
+    def prompt(state, old):
+        existing = state.get("summary") or ""
+        text = (f"Existing summary:\n{existing}\n\n" if existing else "") + f"New conversation:\n{_transcript(old)}"
+        return [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=text)]
+
+    def update(old, response):
+        return {
+            "summary": response.content,
+            "messages": [RemoveMessage(id=m.id) for m in old],
+        }
+
+    def summarize(state, config):
+        old = messages_to_fold(state)
+        response = model.invoke(prompt(state, old), {**config, "tags": [SILENT_TAG]})
+        return update(old, response)
+
+    async def asummarize(state, config):
+        old = messages_to_fold(state)
+        response = await model.ainvoke(prompt(state, old), {**config, "tags": [SILENT_TAG]})
+        return update(old, response)
+
+    return RunnableLambda(summarize, asummarize)
+
+
+def forget_last_turn(agent, config):
+    """Remove the latest question and everything after it from the thread's memory.
+
+    Used before asking the same question again (e.g. with a more capable
+    model), so the conversation doesn't contain it twice.
+    """
+    messages = agent.get_state(config).values.get("messages", [])
+    starts = _turn_starts(messages)
+    if starts:
+        agent.update_state(config, {"messages": [RemoveMessage(id=m.id) for m in messages[starts[-1]:]]})
+
+
+def remember_turn(agent, config, question, answer):
+    """Add a question and its answer to the thread's memory without running the agent.
+
+    Used when an answer is served from a cache, so follow-up questions still
+    see the turn they follow up on.
+    """
+    agent.update_state(config, {"messages": [HumanMessage(content=question), AIMessage(content=answer)]}, as_node="agent")
+
+
+class BoundedMemorySaver(MemorySaver):
+    """In-memory checkpointer that keeps only the latest checkpoint of the most recent sessions.
+
+    The stock ``MemorySaver`` keeps every checkpoint of every thread forever;
+    chat memory only ever needs the latest one.
+    """
+
+    def __init__(self, max_threads=MEMORY_MAX_SESSIONS, keep_checkpoints=2, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.keep_checkpoints = keep_checkpoints
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata):
+        result = super().put(config, checkpoint, metadata)
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            checkpoints = self.storage[thread_id]
+            for ts in sorted(checkpoints)[:-self.keep_checkpoints]:
+                del checkpoints[ts]
+                self.writes.pop((thread_id, ts), None)
+            self._recent[thread_id] = True
+            self._recent.move_to_end(thread_id)
+            while len(self._recent) > self.max_threads:
+                evicted, _ = self._recent.popitem(last=False)
+                self._drop(evicted)
+        return result
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._recent.pop(thread_id, None)
+            self._drop(thread_id)
+
+    def _drop(self, thread_id):
+        for ts in self.storage.pop(thread_id, {}):
+            self.writes.pop((thread_id, ts), None)
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """Return the process-wide checkpointer holding every session's conversation."""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = BoundedMemorySaver()
+        return _checkpointer
+
+
+def session_config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
@@ -0,0 +1,194 @@
+"""Speculative prefetch of search results.
+
+Before a question is sent, the searches it will need are often predictable:
+the example shown in the input box, a question typed but not yet sent, or a
+follow-up to the answer just given. :class:`Prefetcher` runs those searches
+in the background so they land in the search cache, and the agent's tool
+call for the real question is then served without a Tavily round trip (the
+cache key ignores filler words, see :func:`response_cache.canonical_query`).
+
+Prefetches cost Tavily credits, so they are off unless ``PREFETCH_ENABLED``
+is set, limited per question asked and per minute for the process, and
+debounced: a newer prefetch for the same session, or the session's real
+question, cancels those that haven't started yet. A search already in
+flight is not interrupted; its results still land in the cache and the real
+question waits for them instead of searching again.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from telemetry import get_metrics
+
+# Prefetch settings
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0").lower() not in ("0", "false", "no")
+PREFETCH_DEBOUNCE = float(os.getenv("PREFETCH_DEBOUNCE", "0.8"))
+PREFETCH_PER_QUESTION = int(os.getenv("PREFETCH_PER_QUESTION", "3"))
+PREFETCH_PER_MINUTE = int(os.getenv("PREFETCH_PER_MINUTE", "30"))
+PREFETCH_FOLLOW_UPS = int(os.getenv("PREFETCH_FOLLOW_UPS", "0"))  # proposed by the fast model per answer; 0 disables
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "8"))
+
+FOLLOW_UP_PROMPT = (
+    "A user asked: {question}\n\nThey were answered: {answer}\n\n"
+    "Write the {count} web search queries they are most likely to need for their next question, "
+    "one per line, without numbering or commentary."
+)
+
+# Sessions whose question budget is tracked at once (least recently active are dropped)
+_MAX_SESSIONS = 1000
+
+
+class _OverBudget(Exception):
+    pass
+
+
+def propose_follow_ups(question, answer, openai_api_key, count=PREFETCH_FOLLOW_UPS):
+    """Ask the fast model for ``count`` searches the user is likely to need next."""
+    from langchain_openai import ChatOpenAI
+    from routing import FAST_MODEL
+    from upstream import UPSTREAM_TIMEOUT, get_http_client
+
+    model = ChatOpenAI(
+        model=FAST_MODEL,
+        api_key=openai_api_key,
+        temperature=0,
+        max_tokens=30 * count,
+        http_client=get_http_client("openai"),
+        max_retries=0,
+        timeout=UPSTREAM_TIMEOUT,
+    )
+    reply = model.invoke(FOLLOW_UP_PROMPT.format(question=question, answer=answer[:1500], count=count))
+    lines = [line.strip().lstrip("-*•0123456789.) ").strip('"') for line in str(reply.content).splitlines()]
+    return [line for line in lines if line][:count]
+
+
+class Prefetcher:
+    """Runs debounced, budgeted background searches per session.
+
+    Thread-safe; one instance is shared by every session (see :func:`get_prefetcher`).
+    """
+
+    def __init__(self, per_question=PREFETCH_PER_QUESTION, per_minute=PREFETCH_PER_MINUTE,
+                 debounce=PREFETCH_DEBOUNCE):
+        self.per_question = per_question
+        self.per_minute = per_minute
+        self.debounce = debounce
+        self.counts = {"fetched": 0, "cached": 0, "cancelled": 0, "over_budget": 0, "failed": 0}
+        self._pending = {}
+        self._spent = OrderedDict()
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def schedule(self, session, queries, max_results, tavily_api_key):
+        """Search ``queries`` for ``session`` after the debounce delay, unless superseded or cancelled first."""
+        queries = [q.strip() for q in queries if len(q.strip()) >= PREFETCH_MIN_CHARS]
+        if queries:
+            self._start(session, lambda: queries, max_results, tavily_api_key)
+
+    def schedule_follow_ups(self, session, question, answer, max_results, openai_api_key, tavily_api_key,
+                            count=PREFETCH_FOLLOW_UPS):
+        """Like :meth:`schedule`, for follow-up searches the fast model proposes from the last answer."""
+        if count > 0:
+            self._start(session, lambda: propose_follow_ups(question, answer, openai_api_key, count),
+                        max_results, tavily_api_key)
+
+    def cancel(self, session):
+        """Drop the session's pending prefetch and renew its budget: it is asking a real question now."""
+        with self._lock:
+            if self._pending.pop(session, None) is not None:
+                self._count("cancelled")
+            self._spent.pop(session, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _start(self, session, queries, max_results, tavily_api_key):
+        job = object()
+        with self._lock:
+            if self._pending.get(session) is not None:
+                self._count("cancelled")
+            self._pending[session] = job
+        timer = threading.Timer(self.debounce, self._run, (session, job, queries, max_results, tavily_api_key))
+        timer.daemon = True
+        timer.start()
+
+    def _current(self, session, job):
+        with self._lock:
+            return self._pending.get(session) is job
+
+    def _run(self, session, job, queries, max_results, tavily_api_key):
+        try:
+            if not self._current(session, job):
+                return
+            from warmup import load_agent_modules
+            load_agent_modules()
+            from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
+            from search_cache import CachedTavilySearchResults
+
+            tool = CachedTavilySearchResults(
+                max_results=max_results,
+                api_wrapper=TavilySearchAPIWrapper(tavily_api_key=tavily_api_key),
+            )
+            for query in queries():
+                if not self._current(session, job):
+                    return
+
+                def load(query=query):
+                    # Only searches that reach Tavily spend the budget
+                    if not self._take(session):
+                        raise _OverBudget()
+                    return tool._search(query)
+
+                try:
+                    fetched = tool.result_cache().prefetch(query, max_results, load)
+                except _OverBudget:
+                    with self._lock:
+                        self._count("over_budget")
+                    return
+                with self._lock:
+                    self._count("fetched" if fetched else "cached")
+        except Exception:
+            with self._lock:
+                self._count("failed")
+        finally:
+            with self._lock:
+                if self._pending.get(session) is job:
+                    del self._pending[session]
+
+    def _take(self, session):
+        # Per-question allowance for the session, and a token bucket for the process
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60.0)
+            self._updated = now
+            spent = self._spent.get(session, 0)
+            if spent >= self.per_question or self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self._spent[session] = spent + 1
+            self._spent.move_to_end(session)
+            while len(self._spent) > _MAX_SESSIONS:
+                self._spent.popitem(last=False)
+            return True
+
+    def _count(self, outcome):
+        # Called with the lock held
+        self.counts[outcome] += 1
+        get_metrics().inc("prefetch_total", outcome=outcome)
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """Return the process-wide prefetcher."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+            get_metrics().add_stats("prefetch", _prefetcher.stats)
+        return _prefetcher
@@ -0,0 +1,80 @@
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, StateGraph
+
+from budget import RunBudget, cut_off, wrap_up_prompt
+from memory import ConversationState, conversation_prompt, make_summarize_node, needs_summary
+from tool_node import ParallelToolNode
+
+
+def create_search_agent(model, tools, *, tool_node=None, checkpointer=None, budget=None):
+    """Build the ReAct graph used by the app, like ``create_react_agent``.
+
+    Unlike the prebuilt helper, the tool-execution node can be replaced; by
+    default a :class:`ParallelToolNode` runs the tool calls of a step concurrently.
+    With a ``checkpointer`` the graph keeps multi-turn memory per ``thread_id``:
+    the model sees a token-budgeted window of recent turns plus a rolling
+    summary of older ones, maintained by a ``summarize`` step.
+
+    Each question runs within a :class:`budget.RunBudget` (by default the
+    ``AGENT_MAX_*`` settings). When it runs out, or another search would take
+    the run past its ``recursion_limit``, the model answers with what it has
+    instead of searching.
+    """
+    chat_model = model
+    model = model.bind_tools(tools)
+    tool_node = tool_node or ParallelToolNode(tools)
+    budget = budget or RunBudget()
+
+    # Continue to the tools while the model keeps asking for them (the history is
+    # empty when memory.forget_last_turn removed the only turn)
+    def should_continue(state):
+        messages = state["messages"]
+        return "continue" if messages and messages[-1].tool_calls else "end"
+
+    def _check(state):
+        started = budget.started(state)
+        usage = budget.usage(state, started)
+        return started, usage, budget.exceeded(usage)
+
+    def _finish(state, response, started, usage):
+        # Searching takes this step, a tools step and another model step to answer; without
+        # room for them before the recursion limit the model has to answer now instead
+        if state["remaining_steps"] < 3 and response.tool_calls:
+            return None
+        return {"messages": [budget.allow_tool_calls(response, usage)], "turn_started": started}
+
+    def _wrap_up(response, limit, started):
+        return {"messages": [cut_off(response, limit)], "turn_started": started}
+
+    # The wrap-up answer comes from the model without tools, so it can't search again
+    def call_model(state, config):
+        started, usage, limit = _check(state)
+        if limit is None:
+            update = _finish(state, model.invoke(conversation_prompt(state), config), started, usage)
+            if update is not None:
+                return update
+            limit = "steps"
+        return _wrap_up(chat_model.invoke(wrap_up_prompt(conversation_prompt(state)), config), limit, started)
+
+    async def acall_model(state, config):
+        started, usage, limit = _check(state)
+        if limit is None:
+            update = _finish(state, await model.ainvoke(conversation_prompt(state), config), started, usage)
+            if update is not None:
+                return update
+            limit = "steps"
+        return _wrap_up(await chat_model.ainvoke(wrap_up_prompt(conversation_prompt(state)), config), limit, started)
+
+    workflow = StateGraph(ConversationState)
+    workflow.add_node("agent", RunnableLambda(call_model, acall_model))
+    workflow.add_node("tools", tool_node)
+    if checkpointer is not None:
+        # Fold old turns into the summary before answering once history outgrows its budget
+        workflow.add_node("summarize", make_summarize_node(chat_model))
+        workflow.set_conditional_entry_point(needs_summary, {"summarize": "summarize", "agent": "agent"})
+        workflow.add_edge("summarize", "agent")
+    else:
+        workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", should_continue, {"continue": "tools", "end": END})
+    workflow.add_edge("tools", "agent")
+    return workflow.compile(checkpointer=checkpointer)
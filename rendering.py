@@ -0,0 +1,99 @@
+"""HTML fragments for the chat transcript.
+
+Every Streamlit rerun re-sends each element to the browser. The transcript
+is therefore rendered in fixed blocks of messages: a finished block produces
+byte-identical markdown on every rerun, which Streamlit's message cache
+recognises so only the growing tail and the live progress are rebuilt.
+"""
+from functools import lru_cache
+from html import escape
+
+from sources import source_label
+
+HISTORY_BLOCK_SIZE = 10
+
+# Served from ./static (see .streamlit/config.toml) instead of a third-party avatar API
+AVATARS = {
+    "user": "app/static/avatar-user.svg",
+    "assistant": "app/static/avatar-assistant.svg",
+}
+
+THINKING_ANIMATION = '<div class="thinking-animation"><div></div><div></div><div></div><div></div></div>'
+
+
+def _bubble(role, content):
+    # Kept on one line: indented HTML would be parsed as a markdown code block
+    return (
+        f'<div class="chat-message {role}">'
+        f'<img src="{AVATARS[role]}" class="avatar" alt="{role}">'
+        f'<div class="message">{content}</div>'
+        f'</div>'
+    )
+
+
+@lru_cache(maxsize=1024)
+def render_message(role, content):
+    """The bubble of a finished message, cached as the history re-renders it on every rerun."""
+    return _bubble(role, content)
+
+
+def format_age(seconds):
+    """``seconds`` as a rounded, human readable duration ("5 minutes", "3 hours")."""
+    for unit, length in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+    return "less than a minute"
+
+
+def render_sources(sources):
+    """Numbered citation links, with each source's snippet as the link's tooltip."""
+    links = " ".join(
+        f'<a class="source-link" href="{escape(s["url"])}" target="_blank" rel="noopener noreferrer" '
+        f'title="{escape(s.get("snippet", ""))}">[{i}] {escape(source_label(s["url"]))}</a>'
+        for i, s in enumerate(sources, 1)
+    )
+    return f'<div class="sources">Sources: {links}</div>'
+
+
+def _message_html(message):
+    content = message["content"]
+    if message.get("sources"):
+        content += render_sources(message["sources"])
+    indexed = message.get("indexed")
+    if indexed:
+        # The age when the answer was served, so the block renders the same on every rerun
+        content += f'<div class="answer-note">⚡ Precomputed answer, refreshed {format_age(indexed["age"])} earlier</div>'
+    return content
+
+
+def history_blocks(messages, size=HISTORY_BLOCK_SIZE):
+    """Split ``messages`` into HTML blocks of ``size`` messages, oldest first."""
+    blocks = []
+    for start in range(0, len(messages), size):
+        chunk = messages[start:start + size]
+        blocks.append("".join(render_message(m["role"], _message_html(m)) for m in chunk))
+    return blocks
+
+
+def render_partial(text):
+    """The assistant bubble for an answer that is still streaming.
+
+    Not cached: every poll shows new text, which would only push finished
+    messages out of :func:`render_message`'s cache.
+    """
+    return _bubble("assistant", f"{text}▌")
+
+
+def render_thinking(status_text):
+    return _bubble("assistant", f"<p>{status_text}</p>{THINKING_ANIMATION}")
+
+
+def timing_table(rows):
+    """Markdown table of per-answer timing breakdowns (see :meth:`telemetry.Trace.summary`)."""
+    columns = list(rows[0])
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in rows:
+        cells = ["" if row.get(c) is None else str(row[c]).replace("|", "\\|") for c in columns]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
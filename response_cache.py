@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from telemetry import get_metrics
+
+# Answer cache settings
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    namespace TEXT NOT NULL,
+    norm_query TEXT NOT NULL,
+    query TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    embedding BLOB,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    sources TEXT,
+    PRIMARY KEY (namespace, norm_query)
+);
+CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used_at);
+"""
+
+
+def normalize_query(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+# Words that don't change what a web search returns, so "Tell me about the latest
+# developments in AI" and the model's "latest developments in AI" share an entry.
+# Question words stay: "who is X" and "how is X" ask different things
+_FILLER_WORDS = frozenset(
+    "a an the of in on at for to about is are was were be "
+    "can could would please tell me show give find search i my you".split()
+)
+
+
+def canonical_query(query):
+    """``query`` normalized and without filler words; falls back to the normalized query if nothing is left."""
+    normalized = normalize_query(query)
+    return " ".join(w for w in normalized.split() if w not in _FILLER_WORDS) or normalized
+
+
+@lru_cache(maxsize=8)
+def openai_embedder(api_key, model="text-embedding-3-small"):
+    """Return an ``embed(text) -> vector`` function backed by OpenAI embeddings."""
+    from langchain_openai import OpenAIEmbeddings
+    from upstream import get_async_http_client, get_http_client
+
+    embeddings = OpenAIEmbeddings(
+        model=model,
+        api_key=api_key,
+        http_client=get_http_client("openai"),
+        http_async_client=get_async_http_client("openai"),
+        max_retries=0,
+    )
+    return embeddings.embed_query
+
+
+def embed_once(embed):
+    """``embed`` remembering its vectors, so the tiers looking up one question embed it only once.
+
+    Wrap the embedder per question (the index and the answer cache then
+    share a single embedding call); returns None for a None ``embed``.
+    """
+    if embed is None:
+        return None
+    vectors = {}
+    lock = threading.Lock()
+
+    def embed_query(text):
+        with lock:
+            if text not in vectors:
+                vectors[text] = embed(text)
+            return vectors[text]
+
+    return embed_query
+
+
+class AnswerCache:
+    """Two-tier (exact + embedding similarity) answer cache persisted in SQLite.
+
+    Entries expire after ``ttl`` seconds and the least recently used entries are
+    evicted once more than ``maxsize`` answers are stored. The similarity tier
+    is only consulted when an ``embed`` function is available.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL, maxsize=ANSWER_CACHE_SIZE,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY, embed=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        if "sources" not in {column for _, column, *_ in self._db.execute("PRAGMA table_info(answers)")}:
+            # Caches written before answers kept their sources
+            self._db.execute("ALTER TABLE answers ADD COLUMN sources TEXT")
+        # In-memory copy of the vectors per namespace for fast similarity search
+        self._vectors = {}
+        for namespace, norm_query, blob in self._db.execute(
+            "SELECT namespace, norm_query, embedding FROM answers WHERE embedding IS NOT NULL"
+        ):
+            self._vectors.setdefault(namespace, {})[norm_query] = np.frombuffer(blob, dtype=np.float32)
+        # Embeddings computed during lookups, reused when the answer gets stored
+        self._pending_vectors = {}
+
+    def get(self, query, namespace="", embed=None):
+        """Return ``{"answer", "query", "sources", "tier", "age"}`` for a fresh match, else None."""
+        norm_query = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            row = self._db.execute(
+                "SELECT query, answer, created_at, sources FROM answers WHERE namespace = ? AND norm_query = ?",
+                (namespace, norm_query),
+            ).fetchone()
+            if row is not None:
+                return self._hit("exact", namespace, norm_query, row, now)
+
+        embed = embed or self.embed
+        if embed is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Embed outside the lock, this may be a network call
+        vector = _safe_embed(embed, query)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self._remember_vector(namespace, norm_query, vector)
+            match = self._nearest(namespace, vector)
+            if match is not None:
+                row = self._db.execute(
+                    "SELECT query, answer, created_at, sources FROM answers WHERE namespace = ? AND norm_query = ?",
+                    (namespace, match),
+                ).fetchone()
+                if row is not None:
+                    return self._hit("semantic", namespace, match, row, now)
+            self.misses += 1
+            return None
+
+    def put(self, query, answer, namespace="", embed=None, sources=None):
+        if not answer:
+            return
+        norm_query = normalize_query(query)
+        with self._lock:
+            vector = self._pending_vectors.pop((namespace, norm_query), None)
+        embed = embed or self.embed
+        if vector is None and embed is not None:
+            vector = _safe_embed(embed, query)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, norm_query, query, answer,
+                 None if vector is None else vector.tobytes(), now, now,
+                 json.dumps(sources, separators=(",", ":")) if sources else None),
+            )
+            if vector is not None:
+                self._vectors.setdefault(namespace, {})[norm_query] = vector
+            self._evict()
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return {**{f"{tier}_hits": n for tier, n in self.hits.items()},
+                    "misses": self.misses, "size": size, "maxsize": self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+            self._vectors.clear()
+            self._pending_vectors.clear()
+
+    def _hit(self, tier, namespace, norm_query, row, now):
+        query, answer, created_at, sources = row
+        self._db.execute(
+            "UPDATE answers SET last_used_at = ? WHERE namespace = ? AND norm_query = ?",
+            (now, namespace, norm_query),
+        )
+        self._db.commit()
+        self.hits[tier] += 1
+        return {"answer": answer, "query": query, "sources": json.loads(sources) if sources else [],
+                "tier": tier, "age": now - created_at}
+
+    def _nearest(self, namespace, vector):
+        candidates = self._vectors.get(namespace)
+        if not candidates:
+            return None
+        keys = list(candidates)
+        scores = np.stack([candidates[k] for k in keys]) @ vector
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def _remember_vector(self, namespace, norm_query, vector):
+        self._pending_vectors[(namespace, norm_query)] = vector
+        # Only keep vectors for lookups that might still be followed by a put
+        while len(self._pending_vectors) > 256:
+            self._pending_vectors.pop(next(iter(self._pending_vectors)))
+
+    def _expire(self, now):
+        expired = self._db.execute(
+            "SELECT namespace, norm_query FROM answers WHERE created_at < ?", (now - self.ttl,)
+        ).fetchall()
+        if expired:
+            self._db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            self._db.commit()
+            self._forget(expired)
+
+    def _evict(self):
+        overflow = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.maxsize
+        if overflow > 0:
+            evicted = self._db.execute(
+                "SELECT namespace, norm_query FROM answers ORDER BY last_used_at LIMIT ?", (overflow,)
+            ).fetchall()
+            self._db.executemany("DELETE FROM answers WHERE namespace = ? AND norm_query = ?", evicted)
+            self._forget(evicted)
+
+    def _forget(self, keys):
+        for namespace, norm_query in keys:
+            self._vectors.get(namespace, {}).pop(norm_query, None)
+
+
+def _safe_embed(embed, text):
+    # The similarity tier is best effort: an embedding failure is just a miss
+    try:
+        return _unit(embed(text))
+    except Exception:
+        return None
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, opening it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnswerCache()
+            get_metrics().add_stats("answer_cache", _default_cache.stats)
+        return _default_cache
+
+
+def cached_stream(cache, query, namespace, stream, embed=None):
+    """Serve ``query`` from ``cache`` or run ``stream()`` and store its answer.
+
+    ``stream`` is a zero-argument callable returning the agent's event
+    iterator (see :mod:`streaming`); on a hit a single ``final`` event with a
+    ``cached`` tier is yielded instead.
+    """
+    hit = cache.get(query, namespace, embed=embed)
+    if hit is not None:
+        yield {"type": "final", "content": hit["answer"], "messages": [], "sources": hit["sources"], "cached": hit["tier"]}
+        return
+    for event in stream():
+        # Answers cut short by the run budget (see budget.py) may be incomplete
+        if event["type"] == "final" and not event.get("cutoff"):
+            cache.put(query, event["content"], namespace, embed=embed, sources=event.get("sources"))
+        yield event
+
+
+async def acached_stream(cache, query, namespace, stream, embed=None):
+    """Async counterpart of :func:`cached_stream`; lookups run in a worker thread."""
+    hit = await asyncio.to_thread(cache.get, query, namespace, embed)
+    if hit is not None:
+        yield {"type": "final", "content": hit["answer"], "messages": [], "sources": hit["sources"], "cached": hit["tier"]}
+        return
+    async for event in stream():
+        if event["type"] == "final" and not event.get("cutoff"):
+            await asyncio.to_thread(cache.put, query, event["content"], namespace, embed, event.get("sources"))
+        yield event
@@ -0,0 +1,207 @@
+"""Per-question routing between a fast and a capable model (``agent_factory.AUTO_MODEL``).
+
+:meth:`ModelRouter.choose` scores a question locally (length, number of
+sub-questions, reasoning and comparison phrasing) and picks the fast model
+for simple lookups and the capable one otherwise. :meth:`ModelRouter.stream`
+runs the chosen model and, if the fast model's answer fails a quality check
+(or the run fails), asks the capable model instead. Failures of the
+providers themselves (see ``upstream.is_unavailable``) aren't escalated: the
+capable model is behind the same providers and would only add load. Decisions are counted
+in :meth:`ModelRouter.stats`, exported as metrics and, with
+``TELEMETRY_JSON_LOGS``, logged.
+"""
+import json
+import os
+import re
+import threading
+
+from streaming import RunCancelled
+from telemetry import TELEMETRY_JSON_LOGS, get_metrics, logger
+from upstream import is_unavailable
+
+FAST_MODEL = os.getenv("ROUTING_FAST_MODEL", "gpt-3.5-turbo-0125")
+CAPABLE_MODEL = os.getenv("ROUTING_CAPABLE_MODEL", "gpt-4-turbo-preview")
+ROUTING_THRESHOLD = int(os.getenv("ROUTING_THRESHOLD", "2"))
+ROUTING_ESCALATE = os.getenv("ROUTING_ESCALATE", "1").lower() not in ("0", "false", "no")
+ROUTING_MIN_ANSWER_CHARS = int(os.getenv("ROUTING_MIN_ANSWER_CHARS", "40"))  # for questions with complexity signals
+
+_REASONING = re.compile(
+    r"\b(why|explain|compare|comparison|versus|vs|difference|differences|pros and cons|analy[sz]e|"
+    r"evaluate|implications?|trade-?offs?|step by step|strategy|recommend|should i|impact|predict)\b"
+)
+_TECHNICAL = re.compile(r"\b(code|algorithm|proof|calculate|derive|equation|architecture)\b")
+_WEAK_ANSWER = re.compile(
+    r"(sorry, need more steps|i (?:could ?n[o']t|can ?n[o']t|was unable to|am unable to) find|"
+    r"i don'?t have (?:access|enough|any)|no (?:relevant )?information (?:was|is) available)",
+    re.IGNORECASE,
+)
+
+
+def classify_query(query, threshold=ROUTING_THRESHOLD):
+    """Score how demanding ``query`` is; returns ``{"complex", "score", "reasons"}``."""
+    text = query.lower()
+    words = len(text.split())
+    # (reason, points): reasoning or comparison alone is enough for the capable model
+    signals = [
+        ("reasoning", 2, _REASONING.search(text)),
+        ("technical", 1, _TECHNICAL.search(text)),
+        ("multi-part", 1, text.count("?") > 1 or len(re.findall(r"\b(?:and|also|then)\b", text)) >= 2),
+        ("long", 1, words > 20),
+        ("very long", 1, words > 50),
+    ]
+    reasons = [reason for reason, _, present in signals if present]
+    score = sum(points for _, points, present in signals if present)
+    return {"complex": score >= threshold, "score": score, "reasons": reasons}
+
+
+def weak_answer_reason(answer, decision=None, min_chars=ROUTING_MIN_ANSWER_CHARS):
+    """Why ``answer`` looks unusable (empty, too short, gave up, found nothing), or None if it passes.
+
+    A simple lookup may rightly be answered in a few words, so the length
+    check only applies when the question's routing ``decision`` found some
+    complexity signals (see :func:`classify_query`).
+    """
+    answer = (answer or "").strip()
+    if not answer:
+        return "empty answer"
+    if decision is not None and decision["reasons"] and len(answer) < min_chars:
+        return "answer too short"
+    match = _WEAK_ANSWER.search(answer)
+    if match:
+        return f"answer says '{match.group(0)}'"
+    return None
+
+
+class ModelRouter:
+    """Picks a model per question and escalates weak fast-model answers.
+
+    Thread-safe; one instance is shared by every session (see :func:`get_router`).
+    """
+
+    def __init__(self, fast_model=FAST_MODEL, capable_model=CAPABLE_MODEL,
+                 threshold=ROUTING_THRESHOLD, escalate=ROUTING_ESCALATE):
+        self.fast_model = fast_model
+        self.capable_model = capable_model
+        self.threshold = threshold
+        self.escalate = escalate
+        self.fast = 0
+        self.capable = 0
+        self.escalations = 0
+        self._lock = threading.Lock()
+
+    def choose(self, query):
+        """Return the routing decision for ``query``: ``{"model", "complex", "score", "reasons"}``."""
+        decision = classify_query(query, self.threshold)
+        decision["model"] = self.capable_model if decision["complex"] else self.fast_model
+        return decision
+
+    def stream(self, query, stream_for):
+        """Answer ``query`` with the routed model; ``stream_for(model, retry)`` returns its events.
+
+        ``retry`` is True for the escalated run, so the caller can first undo
+        what the fast run left in the conversation memory. The capable
+        model's run is preceded by an ``escalate`` event (clients should
+        discard the text streamed so far) and the ``final`` event carries the
+        decision as ``route``.
+        """
+        decision = self.choose(query)
+        model = decision["model"]
+        final = None
+        reason = None
+        try:
+            for event in stream_for(model, False):
+                if event["type"] == "final":
+                    final = event
+                else:
+                    yield event
+        except RunCancelled:
+            raise
+        except Exception as e:
+            if model == self.capable_model or not self.escalate or is_unavailable(e):
+                raise
+            reason = f"fast model failed: {e}"
+        if final is not None and model != self.capable_model:
+            reason = weak_answer_reason(final["content"], decision)
+        if reason is not None and self.escalate and model != self.capable_model:
+            yield {"type": "escalate", "from": model, "to": self.capable_model, "reason": reason}
+            for event in stream_for(self.capable_model, True):
+                if event["type"] == "final":
+                    final = event
+                else:
+                    yield event
+            model = self.capable_model
+        else:
+            reason = None
+        route = self._record(decision, model, reason)
+        if final is not None:
+            yield {**final, "route": route}
+
+    async def astream(self, query, astream_for):
+        """Async counterpart of :meth:`stream`."""
+        decision = self.choose(query)
+        model = decision["model"]
+        final = None
+        reason = None
+        try:
+            async for event in astream_for(model, False):
+                if event["type"] == "final":
+                    final = event
+                else:
+                    yield event
+        except Exception as e:
+            if model == self.capable_model or not self.escalate or is_unavailable(e):
+                raise
+            reason = f"fast model failed: {e}"
+        if final is not None and model != self.capable_model:
+            reason = weak_answer_reason(final["content"], decision)
+        if reason is not None and self.escalate and model != self.capable_model:
+            yield {"type": "escalate", "from": model, "to": self.capable_model, "reason": reason}
+            async for event in astream_for(self.capable_model, True):
+                if event["type"] == "final":
+                    final = event
+                else:
+                    yield event
+            model = self.capable_model
+        else:
+            reason = None
+        route = self._record(decision, model, reason)
+        if final is not None:
+            yield {**final, "route": route}
+
+    def stats(self):
+        with self._lock:
+            return {"fast": self.fast, "capable": self.capable, "escalations": self.escalations}
+
+    def _record(self, decision, model, escalation):
+        route = {
+            "model": model,
+            "routed_to": decision["model"],
+            "score": decision["score"],
+            "reasons": decision["reasons"],
+            "escalated": escalation,
+        }
+        with self._lock:
+            if decision["model"] == self.fast_model:
+                self.fast += 1
+            else:
+                self.capable += 1
+            if escalation:
+                self.escalations += 1
+        get_metrics().inc("route_decisions_total", routed_to=decision["model"], answered_by=model)
+        if TELEMETRY_JSON_LOGS:
+            logger.info(json.dumps({"event": "route", **route}))
+        return route
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide model router."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+            get_metrics().add_stats("routing", _router.stats)
+        return _router
@@ -0,0 +1,190 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import get_metrics
+
+# Background execution settings
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "32"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many agent runs are already waiting for a worker."""
+
+
+class AgentRun:
+    """State of one background agent run, updated by the worker and polled by the UI."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self.id = next(self._ids)
+        self.status = QUEUED
+        self.text = ""
+        self.steps = []
+        self.result = None
+        self.cached = None
+        self.timing = None
+        self.route = None
+        self.sources = []
+        self.indexed = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stop = threading.Event()
+        self._future = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def queue_wait(self):
+        """Seconds spent waiting for a worker (so far, if still queued)."""
+        return (self.started_at or time.time()) - self.submitted_at
+
+    def cancel(self):
+        """Drop the run if it is still queued, otherwise stop it at the next token or step."""
+        self.stop.set()
+        with self._lock:
+            if self._future is not None and self._future.cancel():
+                self._finish(CANCELLED)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "text": self.text,
+                "steps": list(self.steps),
+                "result": self.result,
+                "cached": self.cached,
+                "timing": self.timing,
+                "route": self.route,
+                "sources": self.sources,
+                "indexed": self.indexed,
+                "error": self.error,
+                "queue_wait": self.queue_wait,
+            }
+
+    def _apply(self, event):
+        with self._lock:
+            if event["type"] == "token":
+                self.text += event["content"]
+            elif event["type"] in ("tool_start", "tool_end"):
+                self.steps.append(event)
+            elif event["type"] == "escalate":
+                # Another model answers from scratch
+                self.text = ""
+                self.steps.append(event)
+            elif event["type"] == "final":
+                self.result = event["content"]
+                self.cached = event.get("cached")
+                self.timing = event.get("timing")
+                self.route = event.get("route")
+                self.sources = event.get("sources") or []
+                self.indexed = event.get("indexed")
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+
+class AgentRunQueue:
+    """Shared pool that runs agent event streams off the Streamlit script thread.
+
+    At most ``max_workers`` runs execute at once and at most ``max_queued``
+    more wait for a worker; beyond that :meth:`submit` raises
+    :class:`QueueFullError` instead of piling up work.
+    """
+
+    def __init__(self, max_workers=AGENT_WORKERS, max_queued=AGENT_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-run")
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def submit(self, stream):
+        """Run ``stream(run)`` in the background and return the :class:`AgentRun`.
+
+        ``stream`` receives the run so it can pass ``run.stop`` on to
+        :func:`streaming.stream_agent`; it must return an event iterator.
+        """
+        run = AgentRun()
+        with self._lock:
+            queued = sum(1 for r in self._pending if r.status == QUEUED)
+            if queued >= self.max_queued:
+                raise QueueFullError("The assistant is busy, please try again in a moment.")
+            self._pending.append(run)
+            run._future = self._executor.submit(self._work, run, stream)
+        # Also fires for runs cancelled before a worker picked them up
+        run._future.add_done_callback(lambda _: self._discard(run))
+        return run
+
+    def position(self, run):
+        """1-based position of a queued run among the runs waiting for a worker."""
+        with self._lock:
+            queued = [r for r in self._pending if r.status == QUEUED]
+        return queued.index(run) + 1 if run in queued else 0
+
+    def stats(self):
+        with self._lock:
+            statuses = [r.status for r in self._pending]
+        return {
+            "running": statuses.count(RUNNING),
+            "queued": statuses.count(QUEUED),
+            "max_workers": self.max_workers,
+            "max_queued": self.max_queued,
+        }
+
+    def _work(self, run, stream):
+        try:
+            with run._lock:
+                if run.stop.is_set():
+                    run._finish(CANCELLED)
+                    return
+                run.status = RUNNING
+                run.started_at = time.time()
+            events = stream(run)
+            try:
+                for event in events:
+                    if run.stop.is_set():
+                        break
+                    run._apply(event)
+            finally:
+                close = getattr(events, "close", None)
+                if close is not None:
+                    close()
+            with run._lock:
+                run._finish(CANCELLED if run.stop.is_set() else DONE)
+        except Exception as e:
+            with run._lock:
+                run._finish(CANCELLED if run.stop.is_set() else FAILED, error=e)
+
+    def _discard(self, run):
+        with self._lock:
+            if run in self._pending:
+                self._pending.remove(run)
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_run_queue():
+    """Return the process-wide run queue shared by all sessions."""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = AgentRunQueue()
+            get_metrics().add_stats("agent_runs", _default_queue.stats)
+        return _default_queue
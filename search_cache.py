@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+
+from langchain_community.tools.tavily_search import TavilySearchResults
+
+from compression import SEARCH_CONTEXT_TOKENS, compress_results
+from memory import estimate_text_tokens
+from response_cache import canonical_query
+from telemetry import get_metrics
+from upstream import ahedged, get_async_http_client, get_http_client, hedged
+
+# Search result cache settings
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "search_cache.sqlite3")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2000"))
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_results (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    max_results INTEGER NOT NULL,
+    results TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS search_results_created ON search_results (created_at);
+"""
+
+
+def search_key(query, max_results):
+    return f"{int(max_results)}:{canonical_query(query)}"
+
+
+class SearchResultCache:
+    """TTL cache of search results with an in-memory LRU over a SQLite store.
+
+    :meth:`fetch` and :meth:`afetch` coalesce concurrent requests for the same
+    key (from threads or coroutines) into a single upstream call.
+    :meth:`prefetch` loads a query ahead of a likely request; when that
+    request comes it counts as a prefetch hit.
+    """
+
+    def __init__(self, path=SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL, maxsize=SEARCH_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.prefetch_hits = 0
+        self._memory = OrderedDict()
+        self._prefetched = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def get(self, query, max_results):
+        with self._lock:
+            return self._get_locked(search_key(query, max_results), time.time())
+
+    def put(self, query, max_results, results):
+        key = search_key(query, max_results)
+        now = time.time()
+        with self._lock:
+            self._remember(key, results, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?, ?)",
+                (key, query, int(max_results), json.dumps(results), now),
+            )
+            self._db.execute("DELETE FROM search_results WHERE created_at < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM search_results WHERE key IN ("
+                "SELECT key FROM search_results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+            self._db.commit()
+
+    def fetch(self, query, max_results, loader):
+        """Return cached results for ``query`` or call ``loader()`` exactly once for it."""
+        key = search_key(query, max_results)
+        results, future, leader = self._claim(key)
+        if results is not None:
+            return results
+        if not leader:
+            try:
+                return future.result()
+            except Exception:
+                # The leader's failure may be its own (a rejected API key), so
+                # don't pass it on to a session with different credentials
+                return loader()
+        return self._lead(key, query, max_results, future, loader)
+
+    async def afetch(self, query, max_results, aloader):
+        """Async counterpart of :meth:`fetch`; ``aloader`` is a coroutine function."""
+        key = search_key(query, max_results)
+        results, future, leader = self._claim(key)
+        if results is not None:
+            return results
+        if not leader:
+            try:
+                return await asyncio.wrap_future(future)
+            except Exception:
+                return await aloader()
+        try:
+            results = await aloader()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, query=query, max_results=max_results, results=results)
+        return results
+
+    def prefetch(self, query, max_results, loader):
+        """Call ``loader()`` for ``query`` unless it is cached or being loaded; return whether it was."""
+        key = search_key(query, max_results)
+        with self._lock:
+            if key in self._inflight or self._get_locked(key, time.time(), count=False) is not None:
+                return False
+            future = self._inflight[key] = Future()
+            self._prefetched[key] = True
+            while len(self._prefetched) > self.maxsize:
+                self._prefetched.popitem(last=False)
+        self._lead(key, query, max_results, future, loader)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "prefetch_hits": self.prefetch_hits, "size": len(self._memory), "maxsize": self.maxsize}
+
+    def _claim(self, key):
+        # Returns (cached results, in-flight future, whether the caller must load)
+        with self._lock:
+            results = self._get_locked(key, time.time())
+            if results is not None or key in self._inflight:
+                # Served by a prefetch, either finished or still in flight
+                if self._prefetched.pop(key, False):
+                    self.prefetch_hits += 1
+            if results is not None:
+                return results, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            future = self._inflight[key] = Future()
+            return None, future, True
+
+    def _lead(self, key, query, max_results, future, loader):
+        try:
+            results = loader()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, query=query, max_results=max_results, results=results)
+        return results
+
+    def _settle(self, key, future, query=None, max_results=None, results=None, error=None):
+        # Only successful result lists are cached; the tool reports errors as strings
+        if error is None and isinstance(results, list):
+            self.put(query, max_results, results)
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(results)
+
+    def _get_locked(self, key, now, count=True):
+        entry = self._memory.get(key)
+        if entry is None:
+            row = self._db.execute(
+                "SELECT results, created_at FROM search_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                entry = self._remember(key, json.loads(row[0]), row[1])
+        if entry is not None and now - entry[1] < self.ttl:
+            self._memory.move_to_end(key)
+            self.hits += count
+            return entry[0]
+        self._memory.pop(key, None)
+        self.misses += count
+        return None
+
+    def _remember(self, key, results, created_at):
+        entry = self._memory[key] = (results, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+        return entry
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """Return the process-wide search result cache, opening it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SearchResultCache()
+            get_metrics().add_stats("search_cache", _default_cache.stats)
+        return _default_cache
+
+
+class CachedTavilySearchResults(TavilySearchResults):
+    """Tavily search tool that serves repeated queries from a :class:`SearchResultCache`.
+
+    The full results are cached; what the model sees is compressed to the
+    passages most relevant to the query within ``context_tokens`` (see
+    :func:`compression.compress_results`).
+    """
+
+    # None uses the process-wide cache, resolved on first search so that building or
+    # printing the tool doesn't open the cache file
+    cache: Optional[SearchResultCache] = None
+    context_tokens: int = SEARCH_CONTEXT_TOKENS
+
+    def result_cache(self):
+        """The cache this tool reads and fills."""
+        return self.cache if self.cache is not None else get_search_cache()
+
+    def _run(self, query, run_manager=None):
+        try:
+            results = self.result_cache().fetch(query, self.max_results, lambda: self._search(query))
+            return self._compress(query, results)
+        except Exception as e:
+            return repr(e)
+
+    async def _arun(self, query, run_manager=None):
+        try:
+            results = await self.result_cache().afetch(query, self.max_results, lambda: self._asearch(query))
+            return self._compress(query, results)
+        except Exception as e:
+            return repr(e)
+
+    def _compress(self, query, results):
+        if not isinstance(results, list):
+            return results
+        compressed = compress_results(query, results, self.context_tokens)
+        metrics = get_metrics()
+        metrics.inc("search_context_tokens_total", sum(estimate_text_tokens(str(r.get("content", ""))) for r in results), stage="raw")
+        metrics.inc("search_context_tokens_total", sum(estimate_text_tokens(str(r.get("content", ""))) for r in compressed), stage="compressed")
+        return compressed
+
+    # Searches go through the pooled clients of upstream.py (retries, circuit
+    # breaker, hedging) rather than the wrapper's own requests/aiohttp calls
+    def _payload(self, query):
+        return {
+            "api_key": self.api_wrapper.tavily_api_key.get_secret_value(),
+            "query": query,
+            "max_results": self.max_results,
+            "search_depth": self.search_depth,
+            "include_domains": self.include_domains,
+            "exclude_domains": self.exclude_domains,
+            "include_answer": self.include_answer,
+            "include_raw_content": self.include_raw_content,
+            "include_images": self.include_images,
+        }
+
+    def _search(self, query):
+        def call():
+            response = get_http_client("tavily").post(TAVILY_SEARCH_URL, json=self._payload(query))
+            response.raise_for_status()
+            return response.json()
+
+        return self.api_wrapper.clean_results(hedged(call)["results"])
+
+    async def _asearch(self, query):
+        async def call():
+            response = await get_async_http_client("tavily").post(TAVILY_SEARCH_URL, json=self._payload(query))
+            response.raise_for_status()
+            return response.json()
+
+        return self.api_wrapper.clean_results((await ahedged(call))["results"])
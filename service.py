@@ -0,0 +1,255 @@
+"""Headless HTTP API for the search agent.
+
+Run with ``uvicorn service:app``. Endpoints:
+
+* ``GET /healthz`` - liveness probe
+* ``GET /metrics`` - Prometheus metrics (see :mod:`telemetry`)
+* ``POST /v1/query`` - ``{"query": str, "model": str, "max_results": int, "stream": bool}``;
+  returns ``{"answer", "sources", "cached", "timing", "route", "indexed"}`` or, with ``stream``, one JSON event per line
+  (see :mod:`streaming`)
+
+Clients identify themselves with ``Authorization: Bearer <key>`` (or
+``X-API-Key``). When ``SERVICE_API_KEYS`` is set only those keys are accepted
+and every key is rate limited separately; when it is unset any client may call
+the service (a warning is logged at startup) and supplied keys are ignored, so
+clients are rate limited per address. The OpenAI and Tavily keys of the
+service itself come from the environment. With ``"model": "auto"`` each
+question is routed to a fast or a capable model (see :mod:`routing`).
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv, find_dotenv
+
+from agent_factory import get_agent, AUTO_MODEL, DEFAULT_MODEL, DEFAULT_MAX_RESULTS, MAX_SEARCH_RESULTS, MODEL_OPTIONS
+from answer_index import aindexed_stream, get_answer_index, start_answer_index
+from response_cache import get_answer_cache, acached_stream, embed_once, openai_embedder
+from routing import get_router
+from streaming import astream_agent
+from telemetry import Trace, atraced, get_metrics
+from upstream import describe_error, is_unavailable
+from warmup import prewarm_agent_modules
+
+_ = load_dotenv(find_dotenv())
+
+# Service settings
+SERVICE_API_KEYS = {k.strip() for k in os.getenv("SERVICE_API_KEYS", "").split(",") if k.strip()}
+SERVICE_RATE_LIMIT = float(os.getenv("SERVICE_RATE_LIMIT", "60"))  # requests per minute per client key
+SERVICE_RATE_BURST = int(os.getenv("SERVICE_RATE_BURST", "10"))
+SERVICE_MAX_CONCURRENCY = int(os.getenv("SERVICE_MAX_CONCURRENCY", "16"))
+SERVICE_MAX_BODY = 64 * 1024
+
+logger = logging.getLogger("service")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = list(headers)
+
+
+class RateLimiter:
+    """Token bucket per client key: ``rate`` requests per minute with bursts of ``burst``.
+
+    A bucket left idle for ``burst / rate`` seconds is full again, the same as
+    a key that was never seen, so such buckets are dropped on a periodic sweep
+    and one-off clients (e.g. per-address keys) don't accumulate.
+    """
+
+    def __init__(self, rate=SERVICE_RATE_LIMIT, burst=SERVICE_RATE_BURST):
+        self.rate = rate / 60.0
+        self.burst = burst
+        self._refill = burst / self.rate
+        self._buckets = {}
+        self._swept = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Take a token for ``key``; return 0 on success or the seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept >= self._refill:
+                self._sweep(now)
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def _sweep(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < self._refill}
+        self._swept = now
+
+
+_rate_limiter = RateLimiter()
+_concurrency = None
+
+
+def _client_key(scope, headers):
+    auth = headers.get("authorization", "")
+    key = auth[7:].strip() if auth.lower().startswith("bearer ") else headers.get("x-api-key", "")
+    if SERVICE_API_KEYS:
+        if key not in SERVICE_API_KEYS:
+            raise HTTPError(401, "Missing or invalid API key")
+        return key
+    # Without configured keys a supplied key proves nothing, and a fresh one per
+    # request would get a fresh bucket; limit per client address instead
+    return (scope.get("client") or ("anonymous",))[0]
+
+
+def _parse_request(body):
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Request body must be JSON")
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise HTTPError(400, "'query' must be a non-empty string")
+    model = payload.get("model", DEFAULT_MODEL)
+    if model not in MODEL_OPTIONS:
+        raise HTTPError(400, f"'model' must be one of: {', '.join(MODEL_OPTIONS)}")
+    max_results = payload.get("max_results", DEFAULT_MAX_RESULTS)
+    if not isinstance(max_results, int) or not 1 <= max_results <= MAX_SEARCH_RESULTS:
+        raise HTTPError(400, f"'max_results' must be an integer between 1 and {MAX_SEARCH_RESULTS}")
+    return query.strip(), model, max_results, bool(payload.get("stream", False))
+
+
+def _answer_events(query, model, max_results, queue_wait=0.0):
+    openai_api_key = os.getenv("OPENAI_API_KEY", "")
+    tavily_api_key = os.getenv("TAVILY_API_KEY", "")
+    trace = Trace("service", queue_wait=queue_wait)
+
+    def astream_for(model, retry=False):
+        agent = get_agent(model, max_results, openai_api_key, tavily_api_key)
+        return astream_agent(agent, query, {"callbacks": [trace.handler]})
+
+    if model == AUTO_MODEL:
+        stream = lambda: get_router().astream(query, astream_for)
+    else:
+        stream = lambda: astream_for(model)
+    # The index and the answer cache share one embedding of the question
+    embed = embed_once(openai_embedder(openai_api_key))
+    cached = lambda: acached_stream(get_answer_cache(), query, f"{model}:{max_results}", stream, embed=embed)
+    # Recurring questions come from the precomputed index, then repeated ones from the answer cache
+    return atraced(aindexed_stream(get_answer_index(), query, cached, embed=embed), trace)
+
+
+def _public(event):
+    # Message objects aren't JSON serializable and clients only need the text
+    return {k: v for k, v in event.items() if k != "messages"}
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > SERVICE_MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _handle_query(scope, receive, send, headers):
+    global _concurrency
+    client = _client_key(scope, headers)
+    retry_after = _rate_limiter.acquire(client)
+    if retry_after:
+        raise HTTPError(429, "Rate limit exceeded", [(b"retry-after", str(int(retry_after) + 1).encode())])
+    query, model, max_results, stream = _parse_request(await _read_body(receive))
+
+    if _concurrency is None:
+        _concurrency = asyncio.Semaphore(SERVICE_MAX_CONCURRENCY)
+    waiting_since = time.perf_counter()
+    async with _concurrency:
+        events = _answer_events(query, model, max_results, queue_wait=time.perf_counter() - waiting_since)
+        if not stream:
+            final = {}
+            async for event in events:
+                if event["type"] == "final":
+                    final = event
+            await _send_json(send, 200, {
+                "answer": final.get("content"),
+                "cached": final.get("cached"),
+                "timing": final.get("timing"),
+                "route": final.get("route"),
+                "indexed": final.get("indexed"),
+                "sources": final.get("sources", []),
+            })
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson"), (b"cache-control", b"no-cache")],
+        })
+        try:
+            async for event in events:
+                line = json.dumps(_public(event)) + "\n"
+                await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        except Exception as e:
+            # Headers are already sent, report the failure in-band
+            line = json.dumps({"type": "error", "message": describe_error(e)}) + "\n"
+            await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if not SERVICE_API_KEYS:
+                    logger.warning("SERVICE_API_KEYS is not set: any client can query the service and spend "
+                                   "its OpenAI and Tavily quota, limited only per client address")
+                prewarm_agent_modules()
+                start_answer_index()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    route = (scope["method"], scope["path"])
+    try:
+        if route == ("GET", "/healthz"):
+            await _send_json(send, 200, {"status": "ok"})
+        elif route == ("GET", "/metrics"):
+            body = get_metrics().render().encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain; version=0.0.4")],
+            })
+            await send({"type": "http.response.body", "body": body})
+        elif route == ("POST", "/v1/query"):
+            await _handle_query(scope, receive, send, headers)
+        else:
+            raise HTTPError(404, "Not found")
+    except HTTPError as e:
+        await _send_json(send, e.status, {"error": e.message}, e.headers)
+    except Exception as e:
+        # Upstream outages are the client's cue to retry later, not a bug here
+        await _send_json(send, 503 if is_unavailable(e) else 500, {"error": describe_error(e)})
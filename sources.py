@@ -0,0 +1,63 @@
+"""Sources of an answer, taken from the search results the agent used.
+
+The search tool's messages already hold each result's URL and text, so the
+sources of an answer are read from the run's final state
+(:func:`extract_sources`) without asking the model for them. Each source is
+stored compactly as ``{"url", "snippet"}``; the link text is derived from the
+URL when it is rendered (:func:`source_label`).
+"""
+import json
+import os
+from urllib.parse import urlsplit
+
+# Citation settings
+SOURCES_MAX = int(os.getenv("SOURCES_MAX", "5"))  # sources kept per answer; 0 keeps none
+SOURCES_SNIPPET_CHARS = int(os.getenv("SOURCES_SNIPPET_CHARS", "160"))
+
+
+def _turn(messages):
+    # Only the current question's tool calls; memory agents' state holds earlier turns too.
+    # Checked by type name so rendering doesn't import langchain_core
+    for i in range(len(messages) - 1, -1, -1):
+        if getattr(messages[i], "type", None) == "human":
+            return messages[i + 1:]
+    return list(messages)
+
+
+def _snippet(text, limit):
+    text = " ".join(str(text).split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def extract_sources(messages, limit=SOURCES_MAX, snippet_chars=SOURCES_SNIPPET_CHARS):
+    """Return up to ``limit`` ``{"url", "snippet"}`` records from the search results of the last turn.
+
+    Results are kept in the order the agent received them, once per URL.
+    Tool messages that aren't search results (errors, timeouts) are skipped.
+    """
+    sources, seen = [], set()
+    for message in _turn(messages):
+        if getattr(message, "type", None) != "tool":
+            continue
+        try:
+            results = json.loads(message.content)
+        except (TypeError, ValueError):
+            continue
+        for result in results if isinstance(results, list) else []:
+            url = result.get("url") if isinstance(result, dict) else None
+            # Links are rendered as-is, so only web URLs are kept
+            if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+                continue
+            if url in seen or len(sources) >= limit:
+                continue
+            seen.add(url)
+            sources.append({"url": url, "snippet": _snippet(result.get("content", ""), snippet_chars)})
+    return sources
+
+
+def source_label(url):
+    """Short link text for ``url``: its host without ``www.``."""
+    host = urlsplit(url).hostname or url
+    return host.removeprefix("www.")
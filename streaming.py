@@ -0,0 +1,156 @@
+import queue
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from sources import extract_sources
+
+# Events produced while an agent run is streaming:
+#   {"type": "token", "content": str}                     - LLM output token
+#   {"type": "tool_start", "name": str, "input": str}     - search tool called
+#   {"type": "tool_end", "name": str, "output": str}      - search tool returned
+#   {"type": "final", "content": str, "messages": list,   - run finished; cutoff names the
+#    "cutoff": str | None, "sources": list}                  budget limit that ended it, sources
+#                                                            the search results used (sources.py)
+# routing.ModelRouter adds, when a weak fast-model answer is retried:
+#   {"type": "escalate", "from": str, "to": str, "reason": str} - discard the text so far
+
+# LLM calls tagged with this (e.g. conversation summaries) are not streamed to the user
+SILENT_TAG = "silent"
+
+_DONE = object()
+
+
+def _as_input(messages):
+    if isinstance(messages, str):
+        messages = [HumanMessage(content=messages)]
+    return {"messages": list(messages)}
+
+
+def _tool_output_text(output):
+    # Tools invoked through the tool node report a ToolMessage, direct
+    # invocations report the raw result
+    return str(getattr(output, "content", output))
+
+
+def _final_event(state):
+    messages = state["messages"]
+    return {
+        "type": "final",
+        "content": messages[-1].content,
+        "messages": messages,
+        "cutoff": messages[-1].response_metadata.get("budget_cutoff"),
+        "sources": extract_sources(messages),
+    }
+
+
+class RunCancelled(Exception):
+    """Raised inside the graph to abort a run whose consumer went away."""
+
+
+class _EventQueueHandler(BaseCallbackHandler):
+    """Forwards LLM tokens and tool calls from the graph's worker threads to a queue."""
+
+    # Let RunCancelled propagate so an in-flight LLM stream is aborted
+    raise_error = True
+
+    def __init__(self, events, stopped):
+        self.events = events
+        self.stopped = stopped
+        self._tool_names = {}
+        self._silent_runs = set()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        if SILENT_TAG in (tags or []):
+            self._silent_runs.add(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._silent_runs.discard(run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if self.stopped():
+            raise RunCancelled()
+        if token and run_id not in self._silent_runs:
+            self.events.put({"type": "token", "content": token})
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name", "tool")
+        self._tool_names[run_id] = name
+        self.events.put({"type": "tool_start", "name": name, "input": input_str})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        # A tool run already ended by a timeout (see tool_node.py) may still finish late
+        if run_id not in self._tool_names:
+            return
+        name = self._tool_names.pop(run_id)
+        self.events.put({"type": "tool_end", "name": name, "output": _tool_output_text(output)})
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        if run_id not in self._tool_names:
+            return
+        name = self._tool_names.pop(run_id)
+        self.events.put({"type": "tool_end", "name": name, "output": f"Error: {error!r}"})
+
+
+def stream_agent(agent, messages, config=None, stop=None):
+    """Run the agent and yield streaming events as they happen.
+
+    Uses the graph's synchronous ``stream`` in a background thread and a
+    callback handler for tokens, so it can be consumed from plain (non-async)
+    code such as the Streamlit script thread or the CLI. Setting ``stop`` (a
+    ``threading.Event``) or closing the generator aborts the run at the next
+    token or graph step.
+    """
+    events = queue.Queue()
+    closed = threading.Event()
+
+    def stopped():
+        return closed.is_set() or (stop is not None and stop.is_set())
+
+    config = dict(config or {})
+    config["callbacks"] = list(config.get("callbacks") or []) + [_EventQueueHandler(events, stopped)]
+
+    def run():
+        try:
+            state = None
+            for state in agent.stream(_as_input(messages), config, stream_mode="values"):
+                if stopped():
+                    raise RunCancelled()
+            events.put(_final_event(state))
+        except BaseException as e:
+            events.put(e)
+        finally:
+            events.put(_DONE)
+
+    worker = threading.Thread(target=run, name="agent-stream", daemon=True)
+    worker.start()
+    try:
+        while True:
+            event = events.get()
+            if event is _DONE:
+                break
+            if isinstance(event, BaseException):
+                raise event
+            yield event
+    finally:
+        closed.set()
+
+
+async def astream_agent(agent, messages, config=None):
+    """Async counterpart of :func:`stream_agent` built on ``astream_events``."""
+    async for event in agent.astream_events(_as_input(messages), config, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            if SILENT_TAG in event.get("tags", []):
+                continue
+            token = event["data"]["chunk"].content
+            if token:
+                yield {"type": "token", "content": token}
+        elif kind == "on_tool_start":
+            yield {"type": "tool_start", "name": event["name"], "input": str(event["data"].get("input"))}
+        elif kind == "on_tool_end":
+            yield {"type": "tool_end", "name": event["name"], "output": _tool_output_text(event["data"].get("output"))}
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            # The outermost chain is the graph itself; its output is the final state
+            yield _final_event(event["data"]["output"])
@@ -0,0 +1,375 @@
+"""Latency and usage telemetry for agent runs.
+
+A :class:`Trace` is attached to one run through its callback handler and
+times every graph node, LLM call and tool call. When the run ends the trace
+is added to the process-wide :class:`Metrics` registry (Prometheus text
+format, see :func:`start_metrics_server` and ``GET /metrics`` in
+``service.py``) and, with ``TELEMETRY_JSON_LOGS`` set, logged as one JSON
+line.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Telemetry settings
+TELEMETRY_JSON_LOGS = os.getenv("TELEMETRY_JSON_LOGS", "").lower() in ("1", "true", "yes")
+TELEMETRY_METRICS_PORT = int(os.getenv("TELEMETRY_METRICS_PORT", "0"))  # 0 disables the endpoint
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# Metric label holding a span's name, per span kind
+_SPAN_LABELS = {"node": "node", "llm": "model", "tool": "tool"}
+
+logger = logging.getLogger("telemetry")
+if TELEMETRY_JSON_LOGS and not logger.handlers:
+    _log_handler = logging.StreamHandler(sys.stderr)
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms rendered in Prometheus text format.
+
+    Components also export their own ``stats()`` dictionaries with
+    :meth:`add_stats`; the numeric values are read at render time.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts, total, count = self._histograms.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (seconds <= bound) for c, bound in zip(counts, self.buckets)]
+            self._histograms[key] = (counts, total + seconds, count + 1)
+
+    def add_stats(self, prefix, stats):
+        """Export ``stats()`` (a dict of numbers) as gauges named ``<prefix>_<key>``."""
+        with self._lock:
+            self._stats[prefix] = stats
+
+    def read_stats(self, prefix):
+        """Current ``stats()`` exported under ``prefix``, or None if nothing registered it yet."""
+        with self._lock:
+            stats = self._stats.get(prefix)
+        return stats() if stats is not None else None
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+            stats = sorted(self._stats.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {bucket}")
+            lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        for prefix, read in stats:
+            try:
+                values = read()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry."""
+    return _metrics
+
+
+def _usage(response):
+    # Streaming responses carry usage on the message, others in llm_output
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class _TraceCallbacks:
+    """Callbacks recording the timing spans of one run into its :class:`Trace` (see :func:`_trace_handler`)."""
+
+    # Cheap and lock-protected, so async runs needn't hop to an executor thread
+    run_inline = True
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._open = {}
+        self._root = None
+
+    def _start(self, run_id, kind, name):
+        self._open[run_id] = (kind, name, time.perf_counter())
+
+    def _end(self, run_id, status="ok", **extra):
+        opened = self._open.pop(run_id, None)
+        if opened is not None:
+            kind, name, started = opened
+            self.trace.add_span(kind, name, time.perf_counter() - started, status, **extra)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None and self._root is None:
+            self._root = run_id
+        elif parent_run_id == self._root and not (kwargs.get("name") or "").startswith("__"):
+            # Direct children of the graph run are its nodes (minus the internal input step)
+            self._start(run_id, "node", kwargs.get("name") or "node")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        model = (invocation_params or {}).get("model") or (invocation_params or {}).get("model_name")
+        self._start(run_id, "llm", model or (metadata or {}).get("ls_model_name") or "llm")
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        # Tool-call chunks stream with empty text and don't count as the answer starting
+        if token:
+            self.trace.first_token()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _usage(response)
+        self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error")
+
+
+_handler_class = None
+
+
+def _trace_handler(trace):
+    # langchain_core takes over half a second to import; the app's first render
+    # creates no handler, so it is only imported once a run is configured
+    global _handler_class
+    if _handler_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        _handler_class = type("_TraceHandler", (_TraceCallbacks, BaseCallbackHandler), {})
+    return _handler_class(trace)
+
+
+class Trace:
+    """Timings of one agent run, from submission to the final answer.
+
+    Pass :attr:`handler` in the run's ``callbacks`` and wrap its events with
+    :func:`traced` (or :func:`atraced`), which finishes the trace and adds
+    its :meth:`summary` to the final event as ``timing``.
+    """
+
+    def __init__(self, source, queue_wait=0.0, metrics=None):
+        self.source = source
+        self.queue_wait = queue_wait
+        self.metrics = metrics or get_metrics()
+        self.spans = []
+        self.cached = None
+        self.cutoff = None
+        self.status = None
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.total = None
+        self._handler = None
+        self._lock = threading.Lock()
+
+    @property
+    def handler(self):
+        """The run's callback handler, created on first use."""
+        with self._lock:
+            if self._handler is None:
+                self._handler = _trace_handler(self)
+            return self._handler
+
+    def add_span(self, kind, name, seconds, status="ok", **extra):
+        with self._lock:
+            self.spans.append({"kind": kind, "name": name, "seconds": round(seconds, 4), "status": status, **extra})
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def summary(self):
+        """Per-phase breakdown: LLM calls, search (the tool step) and the remaining graph overhead."""
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        with self._lock:
+            spans = list(self.spans)
+        llm = [s for s in spans if s["kind"] == "llm"]
+        tools = [s for s in spans if s["kind"] == "tool"]
+        llm_seconds = sum(s["seconds"] for s in llm)
+        # Tool calls of one step run concurrently, so search time is the wall time of the tool steps
+        search_seconds = sum(s["seconds"] for s in spans if s["kind"] == "node" and s["name"] == "tools")
+        return {
+            "total": round(total, 3),
+            "queue_wait": round(self.queue_wait, 3),
+            "first_token": round(self.first_token_at - self.started, 3) if self.first_token_at else None,
+            "llm": round(llm_seconds, 3),
+            "search": round(search_seconds, 3),
+            "other": round(max(total - llm_seconds - search_seconds, 0.0), 3),
+            "llm_calls": len(llm),
+            "tool_calls": len(tools),
+            "prompt_tokens": sum(s.get("prompt_tokens", 0) for s in llm),
+            "completion_tokens": sum(s.get("completion_tokens", 0) for s in llm),
+            "cached": self.cached,
+            "cutoff": self.cutoff,
+        }
+
+    def finish(self, status="ok"):
+        """Record the run in the metrics registry and the JSON log (once)."""
+        if self.status is not None:
+            return
+        self.status = status
+        self.total = time.perf_counter() - self.started
+        summary = self.summary()
+        metrics = self.metrics
+        metrics.observe("agent_run_seconds", self.total, source=self.source, status=status)
+        metrics.observe("agent_queue_wait_seconds", self.queue_wait, source=self.source)
+        if summary["first_token"] is not None:
+            metrics.observe("agent_first_token_seconds", summary["first_token"], source=self.source)
+        metrics.inc("agent_answers_total", source=self.source, cached=self.cached or "none")
+        for span in self.spans:
+            labels = {_SPAN_LABELS[span["kind"]]: span["name"], "status": span["status"]}
+            metrics.observe(f"agent_{span['kind']}_seconds", span["seconds"], **labels)
+            if span["kind"] == "llm":
+                metrics.inc("agent_llm_tokens_total", span.get("prompt_tokens", 0), model=span["name"], kind="prompt")
+                metrics.inc("agent_llm_tokens_total", span.get("completion_tokens", 0), model=span["name"], kind="completion")
+        if TELEMETRY_JSON_LOGS:
+            logger.info(json.dumps({
+                "event": "agent_run",
+                "time": time.time(),
+                "source": self.source,
+                "status": status,
+                **summary,
+                "spans": self.spans,
+            }))
+
+
+def traced(events, trace):
+    """Pass ``events`` through, finishing ``trace`` when the run ends."""
+    status = "cancelled"
+    try:
+        for event in events:
+            if event["type"] == "final":
+                trace.cached = event.get("cached")
+                trace.cutoff = event.get("cutoff")
+                trace.finish("ok")
+                event = {**event, "timing": trace.summary()}
+            yield event
+        status = "ok"
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        trace.finish(status)
+
+
+async def atraced(events, trace):
+    """Async counterpart of :func:`traced`."""
+    status = "cancelled"
+    try:
+        async for event in events:
+            if event["type"] == "final":
+                trace.cached = event.get("cached")
+                trace.cutoff = event.get("cutoff")
+                trace.finish("ok")
+                event = {**event, "timing": trace.summary()}
+            yield event
+        status = "ok"
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        trace.finish(status)
+
+
+def observe_render(seconds):
+    """Record the duration of one Streamlit script run."""
+    get_metrics().observe("app_script_seconds", seconds)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=TELEMETRY_METRICS_PORT):
+    """Serve ``/metrics`` on ``port`` from a background thread (once per process).
+
+    Used by the Streamlit app, which can't add routes of its own; does
+    nothing when ``port`` is 0.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+        except OSError as e:
+            logger.warning("metrics endpoint not started on port %s: %s", port, e)
+            return
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
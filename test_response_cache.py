@@ -0,0 +1,12 @@
+from response_cache import canonical_query
+
+
+def test_filler_words_are_ignored():
+    assert canonical_query("Tell me about the latest developments in AI") == canonical_query("latest developments in AI")
+
+
+def test_question_words_are_kept():
+    for first, second in [("Who is Sam Altman?", "How is Sam Altman?"),
+                          ("What is Rust?", "Which is Rust?"),
+                          ("Do they ship to Canada?", "Did they ship to Canada?")]:
+        assert canonical_query(first) != canonical_query(second)
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from langchain_core.callbacks.manager import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables.config import (
+    ContextThreadPoolExecutor,
+    get_async_callback_manager_for_config,
+    get_callback_manager_for_config,
+    get_config_list,
+)
+from langgraph.prebuilt import ToolNode
+
+# Tool execution settings
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "20"))
+
+TOOL_TIMEOUT_TEMPLATE = "Error: {name} did not respond within {timeout:g} seconds. Answer with the other results."
+
+
+class ParallelToolNode(ToolNode):
+    """Tool node that runs all tool calls of one agent step concurrently.
+
+    At most ``max_concurrency`` calls run at once and each call is given
+    ``timeout`` seconds; a call that times out is reported back to the model as
+    an error message instead of stalling the whole step, and its tool run ends
+    with ``on_tool_error`` for the callbacks. Async calls are cancelled at the
+    timeout. A sync call can't be interrupted, so it keeps its worker thread
+    until it returns, and whatever it returns late is discarded.
+    """
+
+    def __init__(self, tools, *, max_concurrency=TOOL_CONCURRENCY, timeout=TOOL_TIMEOUT, **kwargs):
+        super().__init__(tools, **kwargs)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+
+    def _func(self, input, config):
+        tool_calls, output_type = self._parse_input(input)
+        # Each call gets a known run id, so a timed-out call's run can be ended for the callbacks
+        config_list = [{**call_config, "run_id": uuid.uuid4()}
+                       for call_config in get_config_list(config, len(tool_calls))]
+        executor = ContextThreadPoolExecutor(max_workers=min(self.max_concurrency, len(tool_calls) or 1))
+        try:
+            futures = [executor.submit(self._run_one, call, call_config)
+                       for call, call_config in zip(tool_calls, config_list)]
+            outputs = []
+            for call, call_config, future in zip(tool_calls, config_list, futures):
+                try:
+                    # Waiting in submission order: each call gets at least `timeout` seconds
+                    outputs.append(future.result(timeout=self.timeout))
+                except FutureTimeoutError:
+                    # A call still queued never started its run; a running one can't be stopped
+                    if not future.cancel():
+                        self._run_manager(call_config).on_tool_error(self._timeout_error(call))
+                    outputs.append(self._timeout_message(call))
+        finally:
+            # Don't wait for calls that timed out, their results are discarded
+            executor.shutdown(wait=False, cancel_futures=True)
+        return outputs if output_type == "list" else {"messages": outputs}
+
+    async def _afunc(self, input, config):
+        tool_calls, output_type = self._parse_input(input)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(call, call_config):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(self._arun_one(call, call_config), self.timeout)
+                except asyncio.TimeoutError:
+                    # A cancelled tool doesn't end its own run
+                    await self._arun_manager(call_config).on_tool_error(self._timeout_error(call))
+                    return self._timeout_message(call)
+
+        config_list = [{**call_config, "run_id": uuid.uuid4()}
+                       for call_config in get_config_list(config, len(tool_calls))]
+        outputs = await asyncio.gather(*(run_one(call, call_config)
+                                         for call, call_config in zip(tool_calls, config_list)))
+        return outputs if output_type == "list" else {"messages": outputs}
+
+    def _timeout_message(self, call):
+        content = TOOL_TIMEOUT_TEMPLATE.format(name=call["name"], timeout=self.timeout)
+        return ToolMessage(content, name=call["name"], tool_call_id=call["id"])
+
+    def _timeout_error(self, call):
+        return TimeoutError(f"{call['name']} timed out after {self.timeout:g} seconds")
+
+    def _run_manager(self, call_config):
+        # The tool run started by the call, as the tool's own callback manager would see it
+        return CallbackManagerForToolRun(run_id=call_config["run_id"],
+                                         **_manager_fields(get_callback_manager_for_config(call_config)))
+
+    def _arun_manager(self, call_config):
+        return AsyncCallbackManagerForToolRun(run_id=call_config["run_id"],
+                                              **_manager_fields(get_async_callback_manager_for_config(call_config)))
+
+
+def _manager_fields(manager):
+    return {
+        "handlers": manager.handlers,
+        "inheritable_handlers": manager.inheritable_handlers,
+        "parent_run_id": manager.parent_run_id,
+        "tags": manager.tags,
+        "inheritable_tags": manager.inheritable_tags,
+        "metadata": manager.metadata,
+        "inheritable_metadata": manager.inheritable_metadata,
+    }
@@ -0,0 +1,367 @@
+"""Shared HTTP layer for the OpenAI and Tavily APIs.
+
+Each provider gets one pooled keep-alive ``httpx`` client per process (sync
+and async) whose transport adds:
+
+* jittered exponential retry of connection errors, timeouts, 429 and 5xx
+  responses (honouring ``Retry-After``), within a per-call deadline that
+  also caps the timeouts of the attempt in flight;
+* a :class:`CircuitBreaker` that fails calls fast with
+  :class:`CircuitOpenError` after repeated failures, until a trial call
+  succeeds again.
+
+:func:`hedged` / :func:`ahedged` optionally send a duplicate of a slow
+idempotent call (the search) and use whichever answers first.
+:func:`describe_error` turns these failures into messages for users.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+
+from telemetry import get_metrics
+
+# Upstream client settings
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "20"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))  # per attempt (connect, and between reads)
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "60"))  # per call, across retries
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "8"))
+UPSTREAM_HEDGE_AFTER = float(os.getenv("UPSTREAM_HEDGE_AFTER", "0"))  # seconds; 0 disables hedging
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET = float(os.getenv("CIRCUIT_RESET", "30"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+PROVIDER_NAMES = {"openai": "OpenAI", "tavily": "Tavily"}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider that has been failing."""
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"{PROVIDER_NAMES.get(provider, provider)} is unavailable after repeated failures")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failures`` consecutive failures -> half-open after ``reset`` seconds.
+
+    While half-open a single trial call is let through; its outcome closes or
+    re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, provider, failures=CIRCUIT_FAILURES, reset=CIRCUIT_RESET):
+        self.provider = provider
+        self.failures = failures
+        self.reset = reset
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise :class:`CircuitOpenError` unless a call may go out now.
+
+        Returns a token when the call is the half-open trial (else None); pass
+        it to :meth:`release` once the call is over, however it ended.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return None
+            waited = time.monotonic() - self._opened_at
+            if self.state == self.OPEN and waited >= self.reset:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and self._trial is None:
+                self._trial = object()
+                return self._trial
+            raise CircuitOpenError(self.provider, max(self.reset - waited, 0.0))
+
+    def release(self, trial):
+        """Let another trial through if ``trial`` ended without an outcome (cancelled, or an unexpected error)."""
+        if trial is None:
+            return
+        with self._lock:
+            if self._trial is trial:
+                self._trial = None
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = None
+            if ok:
+                self.state = self.CLOSED
+                self.consecutive_failures = 0
+                return
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failures:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures, "opened": self.opened}
+
+
+def backoff_delay(attempt, base=UPSTREAM_BACKOFF, cap=UPSTREAM_BACKOFF_MAX):
+    """Full-jitter exponential backoff before retry number ``attempt`` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after(response):
+    try:
+        return min(float(response.headers.get("retry-after", "")), UPSTREAM_BACKOFF_MAX)
+    except ValueError:
+        return None
+
+
+class _RetryPolicy:
+    """Decides, per attempt, whether and how long to wait before retrying."""
+
+    def __init__(self, provider, breaker, max_retries, deadline):
+        self.provider = provider
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.deadline = deadline
+
+    def start(self):
+        """Check the breaker; returns the call's deadline and its half-open trial token."""
+        trial = self.breaker.allow()
+        return time.monotonic() + self.deadline, trial
+
+    def bound(self, request, timeouts, ends_at):
+        """Cap the attempt's timeouts at the time left before the deadline, so a hung attempt can't outlive it."""
+        remaining = max(ends_at - time.monotonic(), 0.001)
+        request.extensions["timeout"] = {
+            key: remaining if timeouts.get(key) is None else min(timeouts[key], remaining)
+            for key in ("connect", "read", "write", "pool")
+        }
+
+    def delay(self, attempt, ends_at, response=None, error=None):
+        """Seconds to wait before retrying, or None to give up with this outcome."""
+        # Server errors and transport failures count against the provider; any other
+        # response (rate limits included) shows it is up
+        self.breaker.record(error is None and response.status_code < 500)
+        if response is not None and response.status_code not in RETRY_STATUS:
+            return None
+        if attempt >= self.max_retries or self.breaker.state == CircuitBreaker.OPEN:
+            return None
+        wait_for = (_retry_after(response) if response is not None else None) or backoff_delay(attempt)
+        if time.monotonic() + wait_for >= ends_at:
+            return None
+        reason = type(error).__name__ if error is not None else str(response.status_code)
+        get_metrics().inc("upstream_retries_total", provider=self.provider, reason=reason)
+        return wait_for
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """Pooled HTTP transport with retry, deadline and circuit breaking for one provider."""
+
+    def __init__(self, provider, breaker, max_retries=UPSTREAM_MAX_RETRIES, deadline=UPSTREAM_DEADLINE, **kwargs):
+        self._inner = httpx.HTTPTransport(**kwargs)
+        self._policy = _RetryPolicy(provider, breaker, max_retries, deadline)
+
+    def handle_request(self, request):
+        ends_at, trial = self._policy.start()
+        timeouts = dict(request.extensions.get("timeout") or {})
+        attempt = 0
+        try:
+            while True:
+                self._policy.bound(request, timeouts, ends_at)
+                try:
+                    response = self._inner.handle_request(request)
+                except httpx.TransportError as e:
+                    wait_for = self._policy.delay(attempt, ends_at, error=e)
+                    if wait_for is None:
+                        raise
+                else:
+                    wait_for = self._policy.delay(attempt, ends_at, response=response)
+                    if wait_for is None:
+                        return response
+                    response.close()
+                time.sleep(wait_for)
+                attempt += 1
+        finally:
+            self._policy.breaker.release(trial)
+
+    def close(self):
+        self._inner.close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of :class:`ResilientTransport`."""
+
+    def __init__(self, provider, breaker, max_retries=UPSTREAM_MAX_RETRIES, deadline=UPSTREAM_DEADLINE, **kwargs):
+        self._inner = httpx.AsyncHTTPTransport(**kwargs)
+        self._policy = _RetryPolicy(provider, breaker, max_retries, deadline)
+
+    async def handle_async_request(self, request):
+        ends_at, trial = self._policy.start()
+        timeouts = dict(request.extensions.get("timeout") or {})
+        attempt = 0
+        try:
+            while True:
+                self._policy.bound(request, timeouts, ends_at)
+                try:
+                    response = await self._inner.handle_async_request(request)
+                except httpx.TransportError as e:
+                    wait_for = self._policy.delay(attempt, ends_at, error=e)
+                    if wait_for is None:
+                        raise
+                else:
+                    wait_for = self._policy.delay(attempt, ends_at, response=response)
+                    if wait_for is None:
+                        return response
+                    await response.aclose()
+                await asyncio.sleep(wait_for)
+                attempt += 1
+        finally:
+            # Cancelled (e.g. the losing copy of a hedged call) or failed unexpectedly
+            self._policy.breaker.release(trial)
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+_breakers = {}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """Return the process-wide circuit breaker of ``provider``."""
+    with _clients_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+            get_metrics().add_stats(f"circuit_{provider}", _breakers[provider].stats)
+        return _breakers[provider]
+
+
+def _client(provider, asynchronous):
+    breaker = get_breaker(provider)
+    with _clients_lock:
+        key = (provider, asynchronous)
+        if key not in _clients:
+            limits = httpx.Limits(max_connections=UPSTREAM_POOL_SIZE, max_keepalive_connections=UPSTREAM_POOL_SIZE)
+            timeout = httpx.Timeout(UPSTREAM_TIMEOUT)
+            if asynchronous:
+                transport = AsyncResilientTransport(provider, breaker, limits=limits)
+                _clients[key] = httpx.AsyncClient(transport=transport, timeout=timeout)
+            else:
+                transport = ResilientTransport(provider, breaker, limits=limits)
+                _clients[key] = httpx.Client(transport=transport, timeout=timeout)
+        return _clients[key]
+
+
+def get_http_client(provider):
+    """Pooled sync client for ``provider`` ("openai" or "tavily"), shared by every session."""
+    return _client(provider, False)
+
+
+def get_async_http_client(provider):
+    """Pooled async client for ``provider``.
+
+    httpx async clients are bound to the event loop that first uses their
+    connections, so this is meant for a single long-lived loop (the API
+    service or a batch run).
+    """
+    return _client(provider, True)
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+def hedged(call, after=UPSTREAM_HEDGE_AFTER):
+    """Return ``call()``, starting a duplicate if the first hasn't finished after ``after`` seconds.
+
+    Only for idempotent calls; the slower duplicate's result is discarded.
+    """
+    if after <= 0:
+        return call()
+    futures = [_hedge_pool.submit(call)]
+    done, _ = wait(futures, timeout=after)
+    if not done:
+        get_metrics().inc("upstream_hedged_total")
+        futures.append(_hedge_pool.submit(call))
+    errors = []
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                return future.result()
+            errors.append(future.exception())
+    raise errors[0]
+
+
+async def ahedged(acall, after=UPSTREAM_HEDGE_AFTER):
+    """Async counterpart of :func:`hedged`; ``acall`` returns a new coroutine per call."""
+    if after <= 0:
+        return await acall()
+    tasks = [asyncio.ensure_future(acall())]
+    done, _ = await asyncio.wait(tasks, timeout=after)
+    if not done:
+        get_metrics().inc("upstream_hedged_total")
+        tasks.append(asyncio.ensure_future(acall()))
+    errors = []
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    return task.result()
+                errors.append(task.exception())
+        raise errors[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _cause(error, kind):
+    # The OpenAI SDK wraps transport errors (ours included) in its own exceptions
+    while error is not None:
+        if isinstance(error, kind):
+            return error
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def describe_error(error):
+    """A message for users explaining ``error``, in place of a raw exception string."""
+    circuit = _cause(error, CircuitOpenError)
+    if circuit is not None:
+        seconds = max(round(circuit.retry_in), 1)
+        return (f"Sorry, {PROVIDER_NAMES.get(circuit.provider, circuit.provider)} is having problems right now. "
+                f"Please try again in about {seconds} second{'s' if seconds != 1 else ''}.")
+    name = type(error).__name__
+    if name == "AuthenticationError":
+        return "Sorry, the OpenAI API key was rejected. Please check it in the Settings tab."
+    if name == "RateLimitError" or (isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429):
+        return "Sorry, the API rate limit was reached. Please wait a moment and try again."
+    if name == "QueueFullError":
+        return str(error)
+    if isinstance(error, (httpx.TimeoutException, TimeoutError)) or name == "APITimeoutError":
+        return "Sorry, the request took too long. Please try again."
+    if isinstance(error, httpx.TransportError) or name == "APIConnectionError":
+        return "Sorry, the AI service couldn't be reached. Please check your connection and try again."
+    return f"Sorry, I encountered an error: {error}"
+
+
+def is_unavailable(error):
+    """True for failures of an upstream provider rather than of the request (HTTP 503 material)."""
+    name = type(error).__name__
+    return _cause(error, CircuitOpenError) is not None or isinstance(error, (httpx.TransportError, TimeoutError)) or name in (
+        "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+    )
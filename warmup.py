@@ -0,0 +1,62 @@
+"""Deferred loading of the agent's heavy dependencies.
+
+langchain_openai, the Tavily tool and langgraph take seconds to import. The
+app imports them on the first query (:func:`load_agent_modules`) or, by
+default, in a background thread once the first page has been sent
+(:func:`prewarm_agent_modules`), so a new worker can render the page before
+paying for them. Import times are recorded in :data:`import_times` and as
+the ``import_seconds`` metric.
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+from telemetry import get_metrics
+
+PREWARM_IMPORTS = os.getenv("PREWARM_IMPORTS", "1").lower() not in ("0", "false", "no")
+
+# In dependency order, so each module's time excludes the ones before it
+HEAVY_MODULES = (
+    "langchain_openai",
+    "langchain_community.tools.tavily_search",
+    "langgraph.graph",
+    "memory",
+    "react_graph",
+    "search_cache",
+    "streaming",
+)
+
+import_times = {}
+
+_load_lock = threading.Lock()
+_prewarm_lock = threading.Lock()
+_prewarm_thread = None
+
+
+def load_agent_modules():
+    """Import every heavy module not loaded yet; blocks while a prewarm is still running."""
+    with _load_lock:
+        for name in HEAVY_MODULES:
+            if name in sys.modules:
+                continue
+            started = time.perf_counter()
+            importlib.import_module(name)
+            import_times[name] = time.perf_counter() - started
+            get_metrics().observe("import_seconds", import_times[name], module=name)
+
+
+def agent_modules_loaded():
+    return all(name in sys.modules for name in HEAVY_MODULES)
+
+
+def prewarm_agent_modules():
+    """Start :func:`load_agent_modules` in a background thread (once per process, unless disabled)."""
+    global _prewarm_thread
+    if not PREWARM_IMPORTS or agent_modules_loaded():
+        return
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=load_agent_modules, name="prewarm-imports", daemon=True)
+            _prewarm_thread.start()